@@ -0,0 +1,94 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from database import open_database, insert_files, compare_with_database, load_compare_page
+
+
+def make_snapshots(tmp, files, seed=0):
+    # Старый и новый снимок: часть файлов изменена, часть удалена, часть добавлена
+    rng = random.Random(seed)
+    old_rows = []
+    new_rows = []
+    for n in range(files):
+        folder = f"Проект_{n // 500:04d}"
+        filename = f"model_{n:07d}.rvt"
+        row = (folder, f"P:\\{folder}\\Работа\\{filename}", filename, 1700000000.0 + n, "user", 1024)
+        draw = rng.random()
+        if draw < 0.05:
+            old_rows.append(row)
+            continue
+        if draw < 0.10:
+            new_rows.append(row)
+            continue
+        old_rows.append(row)
+        new_rows.append(row[:3] + (row[3] + 3600,) + row[4:] if draw < 0.20 else row)
+    paths = []
+    for name, rows in (("old.db", old_rows), ("new.db", new_rows)):
+        conn = open_database(os.path.join(tmp, name))
+        insert_files(conn, rows)
+        conn.close()
+        paths.append(os.path.join(tmp, name))
+    return paths
+
+
+def legacy_compare(conn, old_db_path):
+    # Прежний compare_databases: обе базы целиком в словари Python
+    old_conn = open_database(old_db_path)
+    old_files = old_conn.execute("SELECT filename, parent_folder, path, last_modified FROM files").fetchall()
+    old_conn.close()
+    new_files = conn.execute("SELECT filename, parent_folder, path, last_modified FROM files").fetchall()
+    old_files_dict = {file[2]: file for file in old_files}
+    new_files_dict = {file[2]: file for file in new_files}
+    rows = []
+    for new_path, new_file in new_files_dict.items():
+        old_file = old_files_dict.get(new_path)
+        tag = "new" if old_file is None else "changed" if old_file[3] != new_file[3] else "normal"
+        rows.append((new_file, tag))
+    for old_path, old_file in old_files_dict.items():
+        if old_path not in new_files_dict:
+            rows.append((old_file, "missing"))
+    return len(rows)
+
+
+def measure(function, *args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def sql_compare(conn, old_db_path, page_size):
+    counts = compare_with_database(conn, old_db_path)
+    # Первая страница и страница из середины - как при прокрутке таблицы
+    load_compare_page(conn, page_size)
+    load_compare_page(conn, page_size, skip=sum(counts.values()) // 2)
+    return sum(counts.values())
+
+
+def run(sizes, page_size):
+    # Память - пик кучи Python (tracemalloc), кэш страниц SQLite в нее не входит
+    print(f"{'files':>8} {'legacy, s':>10} {'legacy, MB':>11} {'sql, s':>7} {'sql, MB':>8}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            old_path, new_path = make_snapshots(tmp, size)
+            conn = open_database(new_path)
+            legacy_rows, legacy_elapsed, legacy_peak = measure(legacy_compare, conn, old_path)
+            rows, elapsed, peak = measure(sql_compare, conn, old_path, page_size)
+            conn.close()
+            assert rows == legacy_rows, (rows, legacy_rows)
+        print(f"{size:>8} {legacy_elapsed:>10.2f} {legacy_peak / 2 ** 20:>11.1f} {elapsed:>7.2f} {peak / 2 ** 20:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение двух снимков базы: словари Python против SQL")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50000, 200000])
+    parser.add_argument("--page-size", type=int, default=50)
+    args = parser.parse_args()
+    run(args.sizes, args.page_size)
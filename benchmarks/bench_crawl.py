@@ -0,0 +1,31 @@
+import argparse
+import tempfile
+import time
+
+from scanner import crawl, get_file_extensions
+from benchmarks.latency_fs import LatencyFS
+from benchmarks.synthetic import make_tree
+
+
+def run(files, latency, worker_counts):
+    file_extensions = get_file_extensions(True, True)
+    fs = LatencyFS(latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        make_tree(tmp, files)
+        print(f"latency {latency * 1000:.1f} ms, {files} files")
+        print(f"{'workers':>8} {'crawl, s':>9} {'files/s':>10}")
+        for workers in worker_counts:
+            started = time.perf_counter()
+            crawled = crawl(tmp, file_extensions, workers=workers, scandir=fs.scandir, stat=fs.stat)
+            count = sum(len(files) for _, _, _, files in crawled if files)
+            elapsed = time.perf_counter() - started
+            print(f"{workers:>8} {elapsed:>9.2f} {count / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Скорость обхода дерева с имитацией сетевой задержки")
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--latency", type=float, default=0.002, help="задержка одного запроса, с")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+    run(args.files, args.latency, args.workers)
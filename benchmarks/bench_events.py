@@ -0,0 +1,78 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from database import open_database
+from monitor import EventPipeline, UPSERT, DELETE
+from scanner import get_file_extensions, scan_to_database
+from benchmarks.synthetic import make_tree
+
+
+def replay(pipeline, paths, events, rate, seed=0):
+    # Имитация потока watchdog: сохранение модели дает серию из нескольких событий по одному пути
+    rng = random.Random(seed)
+    interval = 1 / rate if rate else 0
+    sent = 0
+    started = time.monotonic()
+    while sent < events:
+        path = rng.choice(paths)
+        kind = DELETE if rng.random() < 0.05 else UPSERT
+        for _ in range(min(rng.randint(2, 8), events - sent)):
+            pipeline.events.put((kind, path, time.monotonic()))
+            sent += 1
+            if interval:
+                delay = started + sent * interval - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+    return sent
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(files, events, rate, debounce, max_delay):
+    with tempfile.TemporaryDirectory() as tmp:
+        tree_root = os.path.join(tmp, "tree")
+        make_tree(tree_root, files)
+        db_path = os.path.join(tmp, "bench.db")
+        file_extensions = get_file_extensions(True, True)
+        conn = open_database(db_path)
+        scan_to_database(conn, tree_root, file_extensions)
+        paths = [row[0] for row in conn.execute("SELECT path FROM files")]
+        conn.close()
+
+        pipeline = EventPipeline(db_path, file_extensions, debounce=debounce, max_delay=max_delay)
+        pipeline.start()
+        started = time.monotonic()
+        sent = replay(pipeline, paths, events, rate)
+        pipeline.stop()
+        elapsed = time.monotonic() - started
+
+        processed = 0
+        batches = 0
+        latencies = []
+        while not pipeline.batches.empty():
+            batch = pipeline.batches.get()
+            batches += 1
+            processed += batch.events
+            latencies += [batch.applied_at - queued_at for queued_at in batch.queued_at]
+        latencies.sort()
+        print(f"events sent {sent}, processed {processed}, batches {batches}, rows written {len(latencies)}")
+        print(f"throughput {processed / elapsed:.0f} events/s over {elapsed:.2f} s")
+        if latencies:
+            print(f"latency p50 {percentile(latencies, 0.5) * 1000:.0f} ms, "
+                  f"p95 {percentile(latencies, 0.95) * 1000:.0f} ms, max {latencies[-1] * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон очереди событий монитора")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--events", type=int, default=100000)
+    parser.add_argument("--rate", type=float, default=0, help="событий в секунду, 0 - без ограничения")
+    parser.add_argument("--debounce", type=float, default=0.5)
+    parser.add_argument("--max-delay", type=float, default=5.0)
+    args = parser.parse_args()
+    run(args.files, args.events, args.rate, args.debounce, args.max_delay)
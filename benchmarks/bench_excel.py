@@ -0,0 +1,93 @@
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import openpyxl
+from openpyxl.styles import Font
+
+from database import open_database, insert_files
+from reports import EXCEL_HEADERS, iter_report_rows, write_excel_report, write_csv_report
+
+try:
+    import resource
+except ImportError:
+    # На Windows модуля нет - пик памяти не выводится
+    resource = None
+
+
+def make_database(db_path, rows):
+    # Все файлы подсвечены: каждая модель в паре со своей выгрузкой
+    conn = open_database(db_path)
+    files = []
+    for n in range(rows):
+        folder = f"Проект_{n // 500:04d}"
+        filename = f"Корпус_{n // 2:06d}.{'ifc' if n % 2 else 'rvt'}"
+        files.append((folder, f"P:\\{folder}\\Работа\\{filename}", filename, 1700000000.0 + n // 2, "user", 1024))
+    insert_files(conn, files)
+    with conn:
+        conn.execute("INSERT INTO matches (source_id, export_id, score) "
+                     "SELECT id, id + 1, 100 FROM files WHERE id % 2 = 1")
+        conn.execute("UPDATE files SET match_dirty = 0")
+    conn.close()
+
+
+def legacy_write_excel_report(save_path, highlighted_files):
+    # Прежний export_to_excel: обычная книга целиком в памяти
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Отчет по файлам"
+    headers = EXCEL_HEADERS
+    sheet.append(headers)
+    for header in headers:
+        cell = sheet[f'{chr(65 + headers.index(header))}1']
+        cell.font = Font(bold=True)
+    for file in highlighted_files:
+        sheet.append(file)
+    workbook.save(save_path)
+
+
+WRITERS = {
+    "legacy xlsx": (legacy_write_excel_report, ".xlsx", True),
+    "write-only xlsx": (write_excel_report, ".xlsx", False),
+    "csv": (write_csv_report, ".csv", False),
+}
+
+
+def run_writer(name, db_path, save_path, results):
+    # Каждый вариант - в своем процессе, чтобы пик RSS не смешивался
+    writer, _, materialize = WRITERS[name]
+    conn = open_database(db_path)
+    started = time.perf_counter()
+    rows = iter_report_rows(conn, 80)
+    writer(save_path, list(rows) if materialize else rows)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None
+    results.put((elapsed, peak))
+
+
+def run(rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        make_database(db_path, rows)
+        print(f"{rows} rows")
+        print(f"{'writer':>16} {'s':>7} {'rows/s':>9} {'peak RSS, MB':>13} {'file, MB':>9}")
+        results = multiprocessing.Queue()
+        for name, (_, extension, _) in WRITERS.items():
+            save_path = os.path.join(tmp, name.replace(" ", "_") + extension)
+            process = multiprocessing.Process(target=run_writer, args=(name, db_path, save_path, results))
+            process.start()
+            elapsed, peak = results.get()
+            process.join()
+            # ru_maxrss в Linux - в КБ
+            peak = f"{peak / 1024:>13.1f}" if peak is not None else f"{'-':>13}"
+            print(f"{name:>16} {elapsed:>7.2f} {rows / elapsed:>9.0f} {peak} "
+                  f"{os.path.getsize(save_path) / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Экспорт подсвеченных файлов: обычная книга, write-only и CSV")
+    parser.add_argument("--rows", type=int, default=100000)
+    run(parser.parse_args().rows)
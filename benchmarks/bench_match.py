@@ -0,0 +1,65 @@
+import argparse
+import os
+import random
+import time
+
+from rapidfuzz import fuzz
+
+from matcher import match_group
+
+
+def legacy_match_group(files, threshold):
+    # Прежний алгоритм apply_highlighting: fuzz.ratio по всем парам i < j,
+    # фильтр по расширениям - уже после сравнения
+    matches = []
+    for i, (key1, name1) in enumerate(files):
+        for j, (key2, name2) in enumerate(files):
+            if i < j:
+                base1, _ = os.path.splitext(name1)
+                base2, _ = os.path.splitext(name2)
+                if fuzz.ratio(base1, base2) >= threshold:
+                    if (name1.endswith(".rvt") and name2.endswith(".ifc")) or \
+                            (name1.endswith(".ifc") and name2.endswith(".rvt")) or \
+                            (name1.endswith(".dwg") and name2.endswith(".ifc")) or \
+                            (name1.endswith(".ifc") and name2.endswith(".dwg")):
+                        matches.append((key1, key2))
+    return matches
+
+
+def make_group(size, seed=0):
+    # Выгрузки одного дня в одной папке: модели и их IFC с вариациями имени
+    rng = random.Random(seed)
+    sections = ("АР", "КР", "ОВ", "ВК", "ЭОМ", "СС")
+    files = []
+    while len(files) < size:
+        n = len(files)
+        base = f"{rng.randrange(16 ** 6):06X}_Корпус_{rng.randint(1, 9)}_{rng.choice(sections)}_R{rng.randint(2019, 2025)}"
+        files.append((n, base + rng.choice((".rvt", ".dwg"))))
+        files.append((n + 1, base + rng.choice(("", "_IFC", "_export", "_v2")) + ".ifc"))
+    return files[:size]
+
+
+def run(sizes, threshold, legacy_limit):
+    print(f"{'files':>7} {'legacy, s':>10} {'cdist, s':>9} {'matches':>8}")
+    for size in sizes:
+        files = make_group(size)
+        started = time.perf_counter()
+        matches = match_group(files, threshold, workers=-1)
+        elapsed = time.perf_counter() - started
+        if size <= legacy_limit:
+            started = time.perf_counter()
+            legacy = legacy_match_group(files, threshold)
+            legacy_elapsed = f"{time.perf_counter() - started:>10.3f}"
+            assert len(legacy) == len(matches), (len(legacy), len(matches))
+        else:
+            legacy_elapsed = f"{'-':>10}"
+        print(f"{size:>7} {legacy_elapsed} {elapsed:>9.3f} {len(matches):>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подсветка одной группы: попарный цикл против cdist")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 1000, 2000, 5000, 20000])
+    parser.add_argument("--threshold", type=int, default=80)
+    parser.add_argument("--legacy-limit", type=int, default=2000, help="не запускать старый цикл на больших группах")
+    args = parser.parse_args()
+    run(args.sizes, args.threshold, args.legacy_limit)
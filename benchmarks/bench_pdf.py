@@ -0,0 +1,113 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from reportlab.lib.pagesizes import letter, landscape
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from reports import write_pdf_report, resolve_font_path
+
+
+def iter_rows(count, seed=0):
+    # Подсвеченные файлы по папкам, пути с пробелами, как на проектных дисках
+    rng = random.Random(seed)
+    sections = ("АР", "КР", "ОВ", "ВК", "ЭОМ")
+    for n in range(count):
+        folder = f"Проект {n // 200:04d} {sections[n // 40 % len(sections)]}"
+        filename = f"Корпус_{rng.randint(1, 9)}_{n:06d}.{'rvt' if n % 2 else 'ifc'}"
+        path = f"P:\\Объекты 2024\\{folder}\\Рабочая документация стадия П\\Работа\\{filename}"
+        yield filename, folder, path, "2024-05-01 12:00:00", "user"
+
+
+def legacy_wrap_text(text, max_width, font, font_size, pdf_canvas):
+    words = text.split(' ')
+    lines = []
+    current_line = words[0]
+    for word in words[1:]:
+        if pdf_canvas.stringWidth(current_line + ' ' + word, font, font_size) < max_width:
+            current_line += ' ' + word
+        else:
+            lines.append(current_line)
+            current_line = word
+    lines.append(current_line)
+    return lines
+
+
+def legacy_write_pdf_report(pdf_path, highlighted_files, font_path):
+    # Прежний create_pdf_report без диалогов: все строки списком, шрифт регистрируется
+    # на каждый вызов, перенос пути пересчитывает ширину всей строки на каждое слово
+    pdfmetrics.registerFont(TTFont('Arial', font_path))
+    c = canvas.Canvas(pdf_path, pagesize=landscape(letter))
+    width, height = landscape(letter)
+    y_position = height - 70
+    files_by_parent_folder = {}
+    for file in highlighted_files:
+        files_by_parent_folder.setdefault(file[1], []).append(file)
+    for parent_folder, files in files_by_parent_folder.items():
+        c.setFont("Arial", 12)
+        c.drawString(30, y_position, f"Папка: {parent_folder}")
+        y_position -= 40
+        c.setFont("Arial", 10)
+        for filename, _, path, last_modified, created_by in files:
+            c.drawString(30, y_position, filename)
+            c.drawString(200, y_position, last_modified)
+            path_max_width = width - 440
+            path_lines = legacy_wrap_text(path, path_max_width, "Arial", 10, c)
+            for line in path_lines:
+                c.drawString(300, y_position, line)
+                y_position -= 12
+            if len(path_lines) == 1 and c.stringWidth(path_lines[0], "Arial", 10) <= path_max_width:
+                c.linkURL(f"file://{path}", (300, y_position + 12, width - 30, y_position + 24), relative=0)
+            y_position -= 8
+            if y_position < 40:
+                c.showPage()
+                c.setFont("Arial", 10)
+                y_position = height - 50
+    c.save()
+
+
+def measure(memory, function, *args):
+    # tracemalloc замедляет reportlab в разы, поэтому время и память - отдельными прогонами
+    started = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - started
+    if not memory:
+        return elapsed, None
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def format_peak(peak):
+    return f"{peak / 2 ** 20:>11.1f}" if peak is not None else f"{'-':>11}"
+
+
+def run(sizes, font_path, memory):
+    font_path = resolve_font_path(font_path)
+    print(f"font {font_path}")
+    print(f"{'rows':>7} {'legacy, s':>10} {'legacy, MB':>11} {'stream, s':>10} {'stream, MB':>11} {'pdf, MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            legacy_path = os.path.join(tmp, f"legacy_{size}.pdf")
+            pdf_path = os.path.join(tmp, f"stream_{size}.pdf")
+            legacy_elapsed, legacy_peak = measure(memory, lambda: legacy_write_pdf_report(
+                legacy_path, list(iter_rows(size)), font_path))
+            elapsed, peak = measure(memory, lambda: write_pdf_report(pdf_path, "bench", iter_rows(size), font_path))
+            print(f"{size:>7} {legacy_elapsed:>10.2f} {format_peak(legacy_peak)} {elapsed:>10.2f} "
+                  f"{format_peak(peak)} {os.path.getsize(pdf_path) / 2 ** 20:>8.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отчет PDF: прежняя генерация против потоковой")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000])
+    parser.add_argument("--font", help="шрифт TTF, по умолчанию - как у отчета")
+    parser.add_argument("--memory", action="store_true", help="еще и пик памяти Python (долгий прогон)")
+    args = parser.parse_args()
+    run(args.sizes, args.font, args.memory)
@@ -0,0 +1,48 @@
+import argparse
+import os
+import tempfile
+import time
+
+from database import open_database
+from scanner import get_file_extensions, scan_to_database
+from benchmarks.latency_fs import LatencyFS
+from benchmarks.synthetic import make_tree
+
+
+def timed_scan(conn, tree_root, file_extensions, fs, incremental):
+    started = time.perf_counter()
+    count = scan_to_database(conn, tree_root, file_extensions, incremental=incremental,
+                             scandir=fs.scandir, stat=fs.stat)
+    return count, time.perf_counter() - started
+
+
+def run(files, noise_dirs, latency, windows):
+    file_extensions = get_file_extensions(True, True)
+    fs = LatencyFS(latency, entry_stat_latency=0 if windows else None)
+    with tempfile.TemporaryDirectory() as tmp:
+        tree_root = os.path.join(tmp, "tree")
+        make_tree(tree_root, files, noise_dirs=noise_dirs)
+        conn = open_database(os.path.join(tmp, "bench.db"))
+        print(f"latency {latency * 1000:.1f} ms, {files} files, {noise_dirs} extra folders per section")
+        count, elapsed = timed_scan(conn, tree_root, file_extensions, fs, incremental=False)
+        print(f"{'full scan':<24} {elapsed:>8.2f} s  {count} files")
+        count, elapsed = timed_scan(conn, tree_root, file_extensions, fs, incremental=True)
+        print(f"{'incremental, unchanged':<24} {elapsed:>8.2f} s  {count} files")
+        # Новая папка "Работа" в одном из проектов
+        new_work_dir = os.path.join(tree_root, "Проект_0000", "Новый", "Работа")
+        os.makedirs(new_work_dir)
+        with open(os.path.join(new_work_dir, "Новый.rvt"), "w"):
+            pass
+        count, elapsed = timed_scan(conn, tree_root, file_extensions, fs, incremental=True)
+        print(f"{'incremental, new folder':<24} {elapsed:>8.2f} s  {count} files")
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Полное сканирование против инкрементального")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--noise-dirs", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.001, help="задержка одного запроса, с")
+    parser.add_argument("--windows", action="store_true", help="stat файлов приходит вместе с листингом")
+    args = parser.parse_args()
+    run(args.files, args.noise_dirs, args.latency, args.windows)
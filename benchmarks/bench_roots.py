@@ -0,0 +1,63 @@
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from database import open_database, new_database_path
+from matcher import refresh_matches
+from scanner import get_file_extensions, scan_to_database, scan_roots
+from benchmarks.latency_fs import LatencyFS
+from benchmarks.synthetic import make_tree
+
+
+def run(roots, files, latency, process_counts, threshold):
+    file_extensions = get_file_extensions(True, True)
+    fs = LatencyFS(latency)
+    crawl_options = {"scandir": fs.scandir, "stat": fs.stat} if latency else {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root_folders = [os.path.join(tmp, f"Проект_{n:02d}") for n in range(roots)]
+        for n, root_folder in enumerate(root_folders):
+            make_tree(root_folder, files, seed=n)
+        print(f"{roots} roots x {files} files, latency {latency * 1000:.1f} ms")
+        print(f"{'mode':>16} {'scan, s':>8} {'match, s':>9} {'files/s':>9}")
+
+        # Как раньше: корни по очереди, у каждого своя база
+        scan_elapsed = match_elapsed = 0
+        total = 0
+        db_folder = os.path.join(tmp, "separate")
+        os.makedirs(db_folder)
+        for root_folder in root_folders:
+            conn = open_database(new_database_path(db_folder, os.path.basename(root_folder), datetime.now()))
+            started = time.perf_counter()
+            total += scan_to_database(conn, root_folder, file_extensions, **crawl_options)
+            scan_elapsed += time.perf_counter() - started
+            started = time.perf_counter()
+            refresh_matches(conn, threshold)
+            match_elapsed += time.perf_counter() - started
+            conn.close()
+        print(f"{'sequential':>16} {scan_elapsed:>8.2f} {match_elapsed:>9.2f} {total / scan_elapsed:>9.0f}")
+
+        for processes in process_counts:
+            conn = open_database(os.path.join(tmp, f"shared_{processes}.db"))
+            started = time.perf_counter()
+            total = sum(scan_roots(conn, root_folders, file_extensions, processes=processes,
+                                   **crawl_options).values())
+            scan_elapsed = time.perf_counter() - started
+            started = time.perf_counter()
+            refresh_matches(conn, threshold, processes=processes)
+            match_elapsed = time.perf_counter() - started
+            conn.close()
+            mode = f"shared, {processes} proc"
+            print(f"{mode:>16} {scan_elapsed:>8.2f} {match_elapsed:>9.2f} {total / scan_elapsed:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Несколько корней: по очереди в свои базы против пула процессов")
+    parser.add_argument("--roots", type=int, default=8)
+    parser.add_argument("--files", type=int, default=5000, help="файлов в каждом корне")
+    parser.add_argument("--latency", type=float, default=0.002, help="задержка одного запроса, с; 0 - без имитации")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--threshold", type=int, default=80)
+    args = parser.parse_args()
+    run(args.roots, args.files, args.latency, args.processes, args.threshold)
@@ -0,0 +1,29 @@
+import argparse
+import os
+import tempfile
+import time
+
+from database import open_database
+from scanner import get_file_extensions, scan_to_database
+from benchmarks.synthetic import make_tree
+
+
+def run(sizes):
+    file_extensions = get_file_extensions(True, True)
+    print(f"{'files':>8} {'scan, s':>9} {'files/s':>10} {'us/file':>9}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            tree_root = os.path.join(tmp, "tree")
+            make_tree(tree_root, size)
+            conn = open_database(os.path.join(tmp, "bench.db"))
+            started = time.perf_counter()
+            count = scan_to_database(conn, tree_root, file_extensions)
+            elapsed = time.perf_counter() - started
+            conn.close()
+        print(f"{count:>8} {elapsed:>9.2f} {count / elapsed:>10.0f} {elapsed / count * 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Время первичного сканирования синтетического дерева")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    run(parser.parse_args().sizes)
@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from database import (open_database, insert_files, count_files, load_files_page, FILE_SORT_KEYS, HIGHLIGHT_ANY,
+                      HIGHLIGHT_MATCHED)
+
+# Прокрутка таблицы результатов глубоко в выборке: страница по ключу соседней строки
+# и переход по полосе прокрутки через OFFSET, для каждой сортировки
+
+
+def make_database(path, files, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for n in range(files):
+        folder = f"P:\\Проект_{n // 500:04d}"
+        filename = f"model_{rng.randrange(10 ** 7):07d}.rvt"
+        rows.append((folder, f"{folder}\\{n:07d}_{filename}", filename, 1700000000.0 + rng.random() * 10 ** 7,
+                     rng.choice(("ivanov", "petrov", None)), 1024))
+    conn = open_database(path)
+    insert_files(conn, rows)
+    # Каждый десятый файл - в паре с оценкой выше порога
+    ids = [row[0] for row in conn.execute("SELECT id FROM files")]
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO matches (source_id, export_id, score) VALUES (?, ?, 90)",
+                         ((file_id, file_id + 1) for file_id in ids[::10]))
+    return conn
+
+
+def timed_ms(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def run(files, page_size, threshold):
+    print(f"{'sort':<14} {'filter':<8} {'count, ms':>10} {'offset, ms':>11} {'key, ms':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = make_database(os.path.join(tmp, "table.db"), files)
+        try:
+            for sort in FILE_SORT_KEYS:
+                for highlight in (HIGHLIGHT_ANY, HIGHLIGHT_MATCHED):
+                    total, count_ms = timed_ms(count_files, conn, threshold, highlight=highlight)
+                    # Окно у конца выборки: переход по полосе прокрутки и следующая страница от его ключа
+                    deep, offset_ms = timed_ms(load_files_page, conn, threshold, page_size, sort,
+                                               highlight=highlight, skip=max(0, total - 2 * page_size))
+                    _, key_ms = timed_ms(load_files_page, conn, threshold, page_size, sort, highlight=highlight,
+                                         after=deep[-1][7:])
+                    print(f"{sort:<14} {highlight:<8} {count_ms:>10.1f} {offset_ms:>11.1f} {key_ms:>8.2f}")
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Страницы таблицы результатов по ключу и через OFFSET")
+    parser.add_argument("--files", type=int, default=200000)
+    parser.add_argument("--page-size", type=int, default=40)
+    parser.add_argument("--threshold", type=int, default=80)
+    args = parser.parse_args()
+    run(args.files, args.page_size, args.threshold)
@@ -0,0 +1,54 @@
+import os
+import time
+
+
+class _SlowEntry:
+    def __init__(self, entry, latency):
+        self._entry = entry
+        self._latency = latency
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_dir(self, follow_symlinks=True):
+        return self._entry.is_dir(follow_symlinks=follow_symlinks)
+
+    def is_file(self, follow_symlinks=True):
+        return self._entry.is_file(follow_symlinks=follow_symlinks)
+
+    def stat(self, follow_symlinks=True):
+        time.sleep(self._latency)
+        return self._entry.stat(follow_symlinks=follow_symlinks)
+
+
+class _SlowScandirIterator:
+    def __init__(self, path, latency, stat_latency):
+        time.sleep(latency)
+        self._iterator = os.scandir(path)
+        self._stat_latency = stat_latency
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._iterator.close()
+
+    def __iter__(self):
+        for entry in self._iterator:
+            yield _SlowEntry(entry, self._stat_latency)
+
+
+class LatencyFS:
+    # Заменитель os.scandir/os.stat для crawl(): каждый листинг и каждый stat
+    # ждут заданное время, как запрос к SMB-шаре.
+    # entry_stat_latency=0 - как на Windows, где DirEntry.stat() приходит вместе с листингом
+    def __init__(self, latency=0.002, stat_latency=None, entry_stat_latency=None):
+        self.latency = latency
+        self.stat_latency = latency if stat_latency is None else stat_latency
+        self.entry_stat_latency = self.stat_latency if entry_stat_latency is None else entry_stat_latency
+
+    def scandir(self, path):
+        return _SlowScandirIterator(path, self.latency, self.entry_stat_latency)
+
+    def stat(self, path):
+        time.sleep(self.stat_latency)
+        return os.stat(path)
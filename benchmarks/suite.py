@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from database import (open_database, compare_with_database, reset_matches, count_files, HIGHLIGHT_MATCHED,
+                      COMPARE_NEW, COMPARE_CHANGED, COMPARE_MISSING)
+from scanner import get_file_extensions, scan_to_database, WORK_FOLDER_NAME
+from matcher import refresh_matches
+from monitor import EventPipeline
+from reports import iter_report_rows, write_pdf_report, write_excel_report, write_csv_report
+from metrics import metrics
+from benchmarks.bench_events import replay, percentile
+from benchmarks.synthetic import make_project_tree
+
+# Полный прогон на одном синтетическом дереве: сканирование, пересканирование, сравнение баз,
+# подсветка, отчеты и поток событий монитора. Каждый прогон дописывается в JSON-историю,
+# новый прогон сравнивается с прошлым при тех же параметрах. История своя у каждой машины,
+# поэтому файл по умолчанию в .gitignore
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Доля файлов, которые меняются между полным сканированием и повторным
+CHANGED_SHARE = 0.01
+DELETED_SHARE = 0.002
+
+
+def code_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_FOLDER, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def change_tree(tree_root, paths, seed=0):
+    # Сохранение части моделей, удаление части файлов и новая папка "Работа"
+    rng = random.Random(seed)
+    paths = sorted(paths)
+    now = time.time()
+    for path in rng.sample(paths, max(1, int(len(paths) * CHANGED_SHARE))):
+        if os.path.exists(path):
+            os.utime(path, (now, now))
+    for path in rng.sample(paths, max(1, int(len(paths) * DELETED_SHARE))):
+        if os.path.exists(path):
+            os.remove(path)
+    work_dir = os.path.join(tree_root, "Объект_новый", "0000_Проект", "Р", "АР", WORK_FOLDER_NAME)
+    os.makedirs(work_dir)
+    for name in ("Новый-Р-АР-К1-00.rvt", "Новый-Р-АР-К1-00_IFC.ifc"):
+        with open(os.path.join(work_dir, name), "w"):
+            pass
+
+
+def run_step(results, name, function, *args):
+    # function возвращает словарь с дополнительными значениями шага; счетчики метрик - только этого шага
+    metrics.reset()
+    started = time.perf_counter()
+    extra = function(*args) or {}
+    elapsed = time.perf_counter() - started
+    results[name] = {"seconds": elapsed, **extra, "counters": metrics.snapshot()["counters"]}
+    print(f"{name:<22} {elapsed:>9.3f} s  " + ", ".join(f"{key} {value}" for key, value in extra.items()))
+
+
+def run_suite(tmp, files, events, thresholds, report_threshold, seed):
+    file_extensions = get_file_extensions(True, True)
+    tree_root = os.path.join(tmp, "tree")
+    db_path = os.path.join(tmp, "bench.db")
+    snapshot_path = os.path.join(tmp, "snapshot.db")
+    make_project_tree(tree_root, files, seed=seed)
+    conn = open_database(db_path)
+    results = {}
+
+    def scan(incremental):
+        count = scan_to_database(conn, tree_root, file_extensions, incremental=incremental)
+        return {"files": count}
+
+    def highlight(threshold):
+        reset_matches(conn)
+        groups = refresh_matches(conn, threshold)
+        return {"groups": groups, "matched": count_files(conn, threshold, highlight=HIGHLIGHT_MATCHED)}
+
+    def compare():
+        counts = compare_with_database(conn, snapshot_path)
+        return {status: counts[status] for status in (COMPARE_NEW, COMPARE_CHANGED, COMPARE_MISSING)}
+
+    def report(writer, path):
+        return {"rows": writer(path, iter_report_rows(conn, report_threshold))}
+
+    try:
+        run_step(results, "full_scan", scan, False)
+        # Снимок до изменений - база для сравнения
+        conn.execute("VACUUM INTO ?", (snapshot_path,))
+        run_step(results, "rescan_unchanged", scan, True)
+        change_tree(tree_root, [row[0] for row in conn.execute("SELECT path FROM files")], seed)
+        run_step(results, "rescan_changed", scan, True)
+        run_step(results, "compare", compare)
+        for threshold in thresholds:
+            run_step(results, f"highlight_{threshold}", highlight, threshold)
+        refresh_matches(conn, report_threshold)
+        run_step(results, "report_pdf", report,
+                 lambda path, rows: write_pdf_report(path, "bench", rows), os.path.join(tmp, "report.pdf"))
+        run_step(results, "report_excel", report, write_excel_report, os.path.join(tmp, "report.xlsx"))
+        run_step(results, "report_csv", report, write_csv_report, os.path.join(tmp, "report.csv"))
+        paths = [row[0] for row in conn.execute("SELECT path FROM files")]
+    finally:
+        conn.close()
+
+    def event_replay():
+        pipeline = EventPipeline(db_path, file_extensions, root=os.path.abspath(tree_root))
+        pipeline.start()
+        started = time.monotonic()
+        sent = replay(pipeline, paths, events, rate=0, seed=seed)
+        pipeline.stop()
+        elapsed = time.monotonic() - started
+        latencies = []
+        while not pipeline.batches.empty():
+            batch = pipeline.batches.get()
+            latencies += [batch.applied_at - queued_at for queued_at in batch.queued_at]
+        latencies.sort()
+        return {"events": sent, "events_per_second": round(sent / elapsed),
+                "latency_p95_ms": round(percentile(latencies, 0.95) * 1000) if latencies else None}
+
+    run_step(results, "event_replay", event_replay)
+    results["full_scan"]["files_per_second"] = round(results["full_scan"]["files"] / results["full_scan"]["seconds"])
+    return results
+
+
+def load_history(history_path):
+    if not os.path.exists(history_path):
+        return []
+    with open(history_path, encoding="utf-8") as history_file:
+        return json.load(history_file)
+
+
+def save_history(history_path, history):
+    with open(history_path, "w", encoding="utf-8") as history_file:
+        json.dump(history, history_file, ensure_ascii=False, indent=2)
+
+
+def print_comparison(previous, entry):
+    print(f"\nvs {previous['version']} recorded {previous['recorded_at']}:")
+    print(f"{'step':<22} {'before, s':>10} {'after, s':>9} {'change':>8}")
+    for name, result in entry["results"].items():
+        before = previous["results"].get(name)
+        if before is None:
+            continue
+        change = (result["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0
+        print(f"{name:<22} {before['seconds']:>10.3f} {result['seconds']:>9.3f} {change:>+7.1f}%")
+
+
+def run(files, events, thresholds, report_threshold, seed, history_path, label):
+    parameters = {"files": files, "events": events, "thresholds": thresholds, "report_threshold": report_threshold,
+                  "seed": seed}
+    print(f"{files} files, {events} events, seed {seed}")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run_suite(tmp, files, events, thresholds, report_threshold, seed)
+    entry = {"recorded_at": datetime.now().isoformat(timespec="seconds"), "version": code_version(), "label": label,
+             "python": sys.version.split()[0], "platform": platform.platform(), "parameters": parameters,
+             "results": results}
+    history = load_history(history_path)
+    previous = [item for item in history if item["parameters"] == parameters]
+    if previous:
+        print_comparison(previous[-1], entry)
+    history.append(entry)
+    save_history(history_path, history)
+    print(f"\nsaved to {history_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Набор замеров на синтетическом дереве проектов с историей в JSON")
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--thresholds", type=int, nargs="+", default=[60, 80, 95])
+    parser.add_argument("--report-threshold", type=int, default=80)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--history", default=HISTORY_PATH, help="JSON-файл истории прогонов")
+    parser.add_argument("--label", help="подпись прогона, например имя ветки")
+    args = parser.parse_args()
+    run(args.files, args.events, args.thresholds, args.report_threshold, args.seed, args.history, args.label)
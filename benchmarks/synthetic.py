@@ -0,0 +1,111 @@
+import os
+import random
+import time
+from datetime import datetime
+
+from scanner import WORK_FOLDER_NAME
+
+SECTIONS = ("АР", "КР", "ОВ", "ВК", "ЭОМ")
+EXTENSIONS = (".rvt", ".ifc", ".dwg")
+NOISE_EXTENSIONS = (".txt", ".bak", ".pdf")
+
+
+def make_tree(base, file_count, files_per_folder=50, noise_dirs=0, seed=0):
+    # Дерево вида base/Проект_N/Раздел/Работа/<файлы> плюс немного мусора;
+    # noise_dirs - сколько посторонних папок (архивы, входящие) добавить в каждый раздел
+    rng = random.Random(seed)
+    now = time.time()
+    created = 0
+    folder_index = 0
+    while created < file_count:
+        project = f"Проект_{folder_index // len(SECTIONS):04d}"
+        section = SECTIONS[folder_index % len(SECTIONS)]
+        work_dir = os.path.join(base, project, section, WORK_FOLDER_NAME)
+        os.makedirs(work_dir, exist_ok=True)
+        with open(os.path.join(base, project, section, "readme.txt"), "w"):
+            pass
+        for n in range(noise_dirs):
+            noise_dir = os.path.join(base, project, section, "Архив", f"{n:03d}")
+            os.makedirs(noise_dir, exist_ok=True)
+            with open(os.path.join(noise_dir, f"{project}_{n:03d}.pdf"), "w"):
+                pass
+        for i in range(min(files_per_folder, file_count - created)):
+            ext = EXTENSIONS[i % len(EXTENSIONS)]
+            path = os.path.join(work_dir, f"{project}_{section}_{i // len(EXTENSIONS):03d}{ext}")
+            with open(path, "w"):
+                pass
+            mtime = now - rng.randint(0, 30) * 86400 - rng.randint(0, 86399)
+            os.utime(path, (mtime, mtime))
+            created += 1
+        with open(os.path.join(work_dir, f"~{project}{rng.choice(NOISE_EXTENSIONS)}"), "w"):
+            pass
+        folder_index += 1
+    return created
+
+
+# Реалистичное дерево: объект / проект / стадия / раздел / "Работа" (иногда с промежуточной папкой корпуса).
+# Модели Revit (или DWG в разделах, где чертят в AutoCAD) и выгрузки IFC с разными вариантами имени
+STAGES = ("П", "Р")
+DWG_SECTIONS = ("ЭОМ", "СС")
+BUILDINGS = ("К1", "К2", "К3", "Паркинг")
+EXPORT_SUFFIXES = ("", "_IFC", "_export", "-IFC2x3", " (1)", "_v2", "_IFC4")
+# Доли моделей: выгрузка в тот же день после сохранения модели, устаревшая выгрузка, выгрузки нет
+FRESH_EXPORT_SHARE = 0.7
+STALE_EXPORT_SHARE = 0.15
+# Возраст последнего сохранения модели - экспоненциальный, в днях
+MEAN_MODEL_AGE_DAYS = 20
+
+
+def _touch(path, mtime):
+    with open(path, "w"):
+        pass
+    os.utime(path, (mtime, mtime))
+
+
+def make_project_tree(base, file_count, models_per_folder=12, archive_share=0.3, seed=0):
+    # Возвращает число файлов, которые проиндексирует сканер (.rvt, .ifc, .dwg в "Работа" без резервных копий);
+    # резервные копии Revit, временные файлы и архивные выгрузки вне "Работа" создаются сверх этого числа
+    rng = random.Random(seed)
+    now = time.time()
+    created = 0
+    folder_index = 0
+    while created < file_count:
+        project_index = folder_index // (len(STAGES) * len(SECTIONS))
+        stage = STAGES[folder_index // len(SECTIONS) % len(STAGES)]
+        section = SECTIONS[folder_index % len(SECTIONS)]
+        project = f"{project_index:04d}_Проект"
+        section_dir = os.path.join(base, f"Объект_{project_index // 10:03d}", project, stage, section)
+        if rng.random() < 0.3:
+            # Разделы, разбитые по корпусам: Работа на уровень глубже
+            section_dir = os.path.join(section_dir, rng.choice(BUILDINGS))
+        work_dir = os.path.join(section_dir, WORK_FOLDER_NAME)
+        os.makedirs(work_dir, exist_ok=True)
+        source_ext = ".dwg" if section in DWG_SECTIONS else ".rvt"
+        for i in range(models_per_folder):
+            if created >= file_count:
+                break
+            base_name = f"{project_index:04d}-{stage}-{section}-{rng.choice(BUILDINGS)}-{i:02d}"
+            model_mtime = now - rng.expovariate(1 / MEAN_MODEL_AGE_DAYS) * 86400
+            _touch(os.path.join(work_dir, base_name + source_ext), model_mtime)
+            created += 1
+            if source_ext == ".rvt" and rng.random() < 0.2:
+                _touch(os.path.join(work_dir, f"{base_name}.{rng.randint(1, 20):04d}.rvt"), model_mtime - 3600)
+            draw = rng.random()
+            if draw >= FRESH_EXPORT_SHARE + STALE_EXPORT_SHARE or created >= file_count:
+                continue
+            if draw < FRESH_EXPORT_SHARE:
+                export_mtime = model_mtime + rng.randint(60, 3600)
+            else:
+                export_mtime = model_mtime - rng.randint(1, 30) * 86400
+            export_name = base_name + rng.choice(EXPORT_SUFFIXES)
+            if rng.random() < 0.1:
+                export_name = export_name.lower()
+            _touch(os.path.join(work_dir, export_name + ".ifc"), export_mtime)
+            created += 1
+            if rng.random() < archive_share:
+                archive_dir = os.path.join(section_dir, "Архив", datetime.fromtimestamp(export_mtime).strftime("%Y-%m"))
+                os.makedirs(archive_dir, exist_ok=True)
+                _touch(os.path.join(archive_dir, export_name + ".ifc"), export_mtime - 86400)
+        _touch(os.path.join(work_dir, f"~$tmp{folder_index}{rng.choice(NOISE_EXTENSIONS)}"), now)
+        folder_index += 1
+    return created
@@ -0,0 +1,261 @@
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from database import (open_database, new_database_path, find_latest_database, count_files, compare_with_database,
+                      compare_with_history, iter_compare_results, load_state_as_of, load_changes_between,
+                      format_mtime, HIGHLIGHT_MATCHED, COMPARE_NEW, COMPARE_CHANGED,
+                      COMPARE_MISSING, COMPARE_UNCHANGED)
+from scanner import get_file_extensions, scan_to_database, scan_roots, DEFAULT_WORKERS
+from metrics import write_metrics, profiled
+
+# Пакетный режим без Tk: для сервера сборки и запуска по расписанию.
+# Тяжелые зависимости (rapidfuzz, reportlab, openpyxl) загружаются только подкомандами, которым они нужны
+
+COMPARE_STATUSES = (COMPARE_NEW, COMPARE_CHANGED, COMPARE_MISSING, COMPARE_UNCHANGED)
+
+
+def parse_date(value):
+    # Дата или дата и время ISO (2024-05-01, 2024-05-01T18:30), без часового пояса - местное время
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверная дата: {value}")
+
+
+def file_extensions_from_args(args):
+    return get_file_extensions(not args.no_rvt, args.dwg)
+
+
+def crawl_options_from_args(args):
+    return {"workers": args.workers, "max_depth": args.max_depth, "exclude_patterns": tuple(args.exclude)}
+
+
+def scan_command(args):
+    file_extensions = file_extensions_from_args(args)
+    crawl_options = crawl_options_from_args(args)
+    if args.db:
+        # Все корни в одну общую базу, каждый корень - в своем процессе
+        conn = open_database(args.db)
+        try:
+            counts = scan_roots(conn, args.roots, file_extensions, processes=args.processes,
+                                incremental=args.incremental, **crawl_options)
+        except OSError as e:
+            print(f"Не удалось просканировать: {e}", file=sys.stderr)
+            return 1
+        finally:
+            conn.close()
+        for root_folder, count in counts.items():
+            print(f"{root_folder}\t{count}\t{args.db}")
+        return 0
+    # Недоступная папка не мешает сканированию остальных, но код возврата - ошибка
+    status = 0
+    for root_folder in args.roots:
+        if not os.path.isdir(root_folder):
+            # Новая пустая база недоступной папки стала бы "последней" для следующего инкрементального обхода
+            print(f"Папка недоступна: {root_folder}", file=sys.stderr)
+            status = 1
+            continue
+        folder_name = os.path.basename(os.path.normpath(root_folder))
+        db_path = find_latest_database(args.db_folder, folder_name) if args.incremental else None
+        incremental = db_path is not None
+        if not incremental:
+            db_path = new_database_path(args.db_folder, folder_name, datetime.now())
+        conn = open_database(db_path)
+        try:
+            count = scan_to_database(conn, root_folder, file_extensions, incremental=incremental, **crawl_options)
+        except OSError as e:
+            print(f"Не удалось просканировать {root_folder}: {e}", file=sys.stderr)
+            status = 1
+            continue
+        finally:
+            conn.close()
+        print(f"{root_folder}\t{count}\t{db_path}")
+    return status
+
+
+def match_command(args):
+    from matcher import refresh_matches
+    conn = open_database(args.db)
+    try:
+        groups = refresh_matches(conn, args.threshold, processes=args.processes)
+        matched = count_files(conn, args.threshold, highlight=HIGHLIGHT_MATCHED)
+    finally:
+        conn.close()
+    print(f"Пересчитано групп: {groups}, файлов с совпадениями: {matched}")
+    return 0
+
+
+def compare_command(args):
+    conn = open_database(args.db)
+    try:
+        if args.at is not None:
+            # Состояние на дату восстанавливается из истории той же базы, старый снимок не нужен
+            counts = compare_with_history(conn, args.at)
+        else:
+            try:
+                counts = compare_with_database(conn, args.old_db)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 1
+        for status in COMPARE_STATUSES:
+            print(f"{status}\t{counts[status]}")
+        if args.list:
+            statuses = args.status or COMPARE_STATUSES
+            for status, filename, parent_folder, path, last_modified, created_by in iter_compare_results(conn):
+                if status in statuses:
+                    print("\t".join((status, parent_folder, path, format_mtime(last_modified))))
+    finally:
+        conn.close()
+    return 0
+
+
+def history_command(args):
+    conn = open_database(args.db)
+    try:
+        if args.at is not None:
+            for _, parent_folder, path, _, last_modified, created_by, _ in load_state_as_of(conn, args.at):
+                print("\t".join((parent_folder, path, format_mtime(last_modified), created_by or "")))
+        else:
+            until = args.until if args.until is not None else datetime.now().timestamp()
+            for recorded_at, event, path, old_path, old_mtime, new_mtime, size in load_changes_between(
+                    conn, args.since, until):
+                print("\t".join((format_mtime(recorded_at), event, old_path or "", path)))
+    finally:
+        conn.close()
+    return 0
+
+
+def report_command(args):
+    from reports import (count_report_rows, iter_report_rows, report_file_name, write_pdf_report,
+                         write_excel_report, write_csv_report)
+    if not args.pdf and not args.xlsx and not args.csv:
+        print("Укажите --pdf, --xlsx и/или --csv", file=sys.stderr)
+        return 2
+    conn = open_database(args.db)
+    try:
+        if not count_report_rows(conn, args.threshold):
+            print("Нет совпадающих файлов для отчета", file=sys.stderr)
+            return 1
+        title = args.title or os.path.splitext(os.path.basename(args.db))[0]
+        if args.pdf:
+            pdf_path = args.pdf
+            if os.path.isdir(pdf_path):
+                pdf_path = os.path.join(pdf_path, report_file_name(title, datetime.now()))
+            try:
+                write_pdf_report(pdf_path, title, iter_report_rows(conn, args.threshold), font_path=args.font)
+            except ValueError as e:
+                print(e, file=sys.stderr)
+                return 1
+            print(pdf_path)
+        if args.xlsx:
+            write_excel_report(args.xlsx, iter_report_rows(conn, args.threshold))
+            print(args.xlsx)
+        if args.csv:
+            write_csv_report(args.csv, iter_report_rows(conn, args.threshold))
+            print(args.csv)
+    finally:
+        conn.close()
+    return 0
+
+
+def verify_command(args):
+    from matcher import refresh_matches
+    from fingerprint import verify_matches, VERIFY_OK, VERIFY_STALE, VERIFY_UNKNOWN
+    conn = open_database(args.db)
+    counts = dict.fromkeys((VERIFY_OK, VERIFY_STALE, VERIFY_UNKNOWN), 0)
+    try:
+        refresh_matches(conn, args.threshold)
+        for source_path, export_path, score, status, originating_system, file_schema, export_hash in \
+                verify_matches(conn, args.threshold, args.workers):
+            counts[status] += 1
+            if args.all or status != VERIFY_OK:
+                print("\t".join((status, f"{score:.0f}", source_path, export_path, originating_system or "",
+                                 file_schema or "", export_hash or "")))
+    finally:
+        conn.close()
+    print(", ".join(f"{status}: {count}" for status, count in counts.items()), file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Поиск актуальных IFC без графического интерфейса")
+    parser.add_argument("--metrics", help="записать метрики в файл: .json - JSON, иначе текст Prometheus")
+    parser.add_argument("--profile", help="записать профиль cProfile в файл (для pstats, snakeviz)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="сканировать папки проектов в базы данных")
+    scan.add_argument("roots", nargs="+", help="корневые папки проектов")
+    target = scan.add_mutually_exclusive_group(required=True)
+    target.add_argument("--db-folder", help="папка для баз данных, по базе на каждую папку проекта")
+    target.add_argument("--db", help="одна общая база для всех папок")
+    scan.add_argument("--incremental", action="store_true",
+                      help="дополнить последнюю базу каждой папки или уже записанные в --db корни")
+    scan.add_argument("--processes", type=int, help="процессов для обхода корней в --db, по умолчанию - по ядрам")
+    scan.add_argument("--dwg", action="store_true", help="учитывать .dwg")
+    scan.add_argument("--no-rvt", action="store_true", help="не учитывать .rvt")
+    scan.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    scan.add_argument("--max-depth", type=int,
+                      help="не спускаться глубже стольких уровней от корня (папка проекта - 1, \"Работа\" - 2)")
+    scan.add_argument("--exclude", action="append", default=[], metavar="МАСКА",
+                      help="не обходить папки с такими именами (маска fnmatch, можно указать несколько раз)")
+    scan.set_defaults(handler=scan_command)
+
+    match = commands.add_parser("match", help="пересчитать оценки схожести имен")
+    match.add_argument("db")
+    match.add_argument("--threshold", type=int, default=80, help="%% схожести")
+    match.add_argument("--processes", type=int, help="считать корни параллельно в стольких процессах")
+    match.set_defaults(handler=match_command)
+
+    compare = commands.add_parser("compare", help="сравнить базу со старой базой или с ее состоянием на дату")
+    compare.add_argument("db")
+    compare.add_argument("old_db", nargs="?")
+    compare.add_argument("--at", type=parse_date, help="сравнить с состоянием этой же базы на дату из истории")
+    compare.add_argument("--list", action="store_true", help="вывести строки, а не только счетчики")
+    compare.add_argument("--status", nargs="+", choices=COMPARE_STATUSES, help="какие строки выводить")
+    compare.set_defaults(handler=compare_command)
+
+    history = commands.add_parser("history", help="состояние базы на дату или изменения за период")
+    history.add_argument("db")
+    period = history.add_mutually_exclusive_group(required=True)
+    period.add_argument("--at", type=parse_date, help="вывести файлы, какими они были на эту дату")
+    period.add_argument("--since", type=parse_date, help="вывести изменения начиная с этой даты")
+    history.add_argument("--until", type=parse_date, help="конец периода для --since, по умолчанию - сейчас")
+    history.set_defaults(handler=history_command)
+
+    report = commands.add_parser("report", help="отчет PDF, Excel и/или CSV по совпадающим файлам")
+    report.add_argument("db")
+    report.add_argument("--threshold", type=int, default=80, help="%% схожести")
+    report.add_argument("--pdf", help="файл или папка для отчета PDF")
+    report.add_argument("--xlsx", help="файл отчета Excel")
+    report.add_argument("--csv", help="файл отчета CSV")
+    report.add_argument("--title", help="имя папки в заголовке отчета")
+    report.add_argument("--font", help="шрифт TTF с кириллицей для отчета PDF, "
+                                       "по умолчанию - из SEARCH_IFCS_FONT, папки fonts или системный")
+    report.set_defaults(handler=report_command)
+
+    verify = commands.add_parser("verify", help="проверить совпавшие IFC по заголовкам и частичным хешам")
+    verify.add_argument("db")
+    verify.add_argument("--threshold", type=int, default=80, help="%% схожести")
+    verify.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="потоков чтения файлов")
+    verify.add_argument("--all", action="store_true", help="выводить и актуальные пары")
+    verify.set_defaults(handler=verify_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "compare" and (args.old_db is None) == (args.at is None):
+        parser.error("compare: укажите старую базу или --at")
+    try:
+        with profiled(args.profile):
+            return args.handler(args)
+    finally:
+        if args.metrics:
+            write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
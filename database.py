@@ -0,0 +1,688 @@
+import os
+import re
+import sqlite3
+from urllib.request import pathname2url
+from datetime import datetime, timedelta
+
+# Сколько строк пишется в одной транзакции при массовой загрузке
+BATCH_SIZE = 10000
+
+DB_TIMESTAMP_FORMAT = '%Y-%m-%d_%H-%M-%S'
+
+
+def new_database_path(db_folder, folder_name, now):
+    return os.path.join(db_folder, f"BD_{folder_name}_{now.strftime(DB_TIMESTAMP_FORMAT)}.db")
+
+
+def find_latest_database(db_folder, folder_name):
+    # Имя целиком: BD_Проект_2_<метка>.db не должна находиться по папке "Проект"
+    pattern = re.compile(rf"^BD_{re.escape(folder_name)}_(\d{{4}}-\d{{2}}-\d{{2}}_\d{{2}}-\d{{2}}-\d{{2}})\.db$")
+    latest = None
+    for name in os.listdir(db_folder):
+        match = pattern.match(name)
+        if match is None:
+            continue
+        try:
+            created = datetime.strptime(match.group(1), DB_TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+        if latest is None or created > latest[0]:
+            latest = (created, name)
+    return os.path.join(db_folder, latest[1]) if latest else None
+
+
+SCHEMA_VERSION = 5
+
+FILES_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS files (
+        id INTEGER PRIMARY KEY,
+        parent_folder TEXT NOT NULL,
+        path TEXT NOT NULL UNIQUE,
+        filename TEXT NOT NULL,
+        last_modified REAL NOT NULL,
+        created_by TEXT,
+        size INTEGER,
+        match_dirty INTEGER NOT NULL DEFAULT 1,
+        root TEXT
+    )
+'''
+
+# Журнал изменений files: только добавление строк, пишется триггерами при любой записи -
+# сканером, монитором, перемещением. recorded_at - время записи изменения в базу, в секундах
+HISTORY_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS file_history (
+        id INTEGER PRIMARY KEY,
+        file_id INTEGER NOT NULL,
+        event TEXT NOT NULL,
+        path TEXT NOT NULL,
+        old_path TEXT,
+        parent_folder TEXT,
+        filename TEXT,
+        old_mtime REAL,
+        new_mtime REAL,
+        size INTEGER,
+        created_by TEXT,
+        recorded_at REAL NOT NULL
+    )
+'''
+
+HISTORY_ADDED = "added"
+HISTORY_MODIFIED = "modified"
+HISTORY_MOVED = "moved"
+HISTORY_DELETED = "deleted"
+
+# unixepoch('subsec') появился только в SQLite 3.42
+NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+# День изменения, по которому файлы группируются для сравнения имен
+DAY_SQL = "date({}, 'unixepoch', 'localtime')"
+
+
+# last_modified старых баз - строка местного времени, новых - секунды
+LEGACY_MTIME_SQL = '''
+               CASE typeof(last_modified)
+                   WHEN 'text' THEN CAST(strftime('%s', last_modified, 'utc') AS REAL)
+                   ELSE last_modified
+               END'''
+
+
+def _migrate_to_v1(conn):
+    # Старые базы: нет UNIQUE на path (дубликаты от INSERT OR REPLACE),
+    # last_modified - строка местного времени, может не быть колонки size.
+    # Из дубликатов остается последняя запись
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(files)")]
+    size = "size" if "size" in columns else "NULL"
+    conn.execute("ALTER TABLE files RENAME TO files_v0")
+    conn.execute(FILES_TABLE_SQL)
+    conn.execute(f'''
+        INSERT INTO files (parent_folder, path, filename, last_modified, created_by, size)
+        SELECT parent_folder, path, filename, {LEGACY_MTIME_SQL}, created_by, {size}
+        FROM files_v0
+        WHERE id IN (SELECT MAX(id) FROM files_v0 GROUP BY path)
+    ''')
+    conn.execute("DROP TABLE files_v0")
+
+
+def _migrate_to_v2(conn):
+    # match_dirty: оценки схожести файла еще не посчитаны или устарели
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(files)")]
+    if "match_dirty" not in columns:
+        conn.execute("ALTER TABLE files ADD COLUMN match_dirty INTEGER NOT NULL DEFAULT 1")
+
+
+def _migrate_to_v3(conn):
+    # root: корневая папка проекта, из обхода которой пришла запись, - в одной базе
+    # может быть несколько корней. У записей старых баз root пустой до первого обхода
+    for table in ("files", "dirs"):
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+        if columns and "root" not in columns:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN root TEXT")
+    # Смена корня тоже меняет группу файла - триггер пересоздается ниже
+    conn.execute("DROP TRIGGER IF EXISTS files_match_invalidate")
+
+
+def _migrate_to_v4(conn):
+    # Журнал начинается с текущего состояния: все файлы - добавленные в момент миграции
+    conn.execute(HISTORY_TABLE_SQL)
+    conn.execute(f'''
+        INSERT INTO file_history (file_id, event, path, parent_folder, filename, new_mtime, size, created_by,
+                                  recorded_at)
+        SELECT id, '{HISTORY_ADDED}', path, parent_folder, filename, last_modified, size, created_by, {NOW_SQL}
+        FROM files
+    ''')
+
+
+def _migrate_to_v5(conn):
+    # created_by входит в ключ сортировки таблицы: с NULL в ключе сравнение строк не работает
+    conn.execute("UPDATE files SET created_by = '' WHERE created_by IS NULL")
+
+
+# MIGRATIONS[n] переводит базу с версии n на n + 1
+MIGRATIONS = [_migrate_to_v1, _migrate_to_v2, _migrate_to_v3, _migrate_to_v4, _migrate_to_v5]
+
+
+def open_database(db_path, check_same_thread=True, timeout=5.0):
+    # check_same_thread=False - подключение создается в одном потоке, а используется в другом.
+    # uri=True - чтобы ATTACH понимал file:...?mode=ro; обычные пути открываются как раньше.
+    # timeout - сколько секунд запись ждет, пока базу держит другой писатель
+    conn = sqlite3.connect(db_path, check_same_thread=check_same_thread, uri=True, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    has_files = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files'").fetchone()
+    with conn:
+        # Миграция и создание схемы - одной транзакцией
+        conn.execute("BEGIN")
+        if has_files:
+            for migrate in MIGRATIONS[version:]:
+                migrate(conn)
+        conn.execute(FILES_TABLE_SQL)
+        # По индексу на каждую сортировку из FILE_SORT_KEYS (path - UNIQUE, id есть в любом индексе)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_folder_modified ON files (parent_folder, last_modified)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_filename ON files (filename)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_modified ON files (last_modified)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_created_by ON files (created_by, path)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_root ON files (root)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_files_match_dirty ON files (match_dirty) WHERE match_dirty = 1")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS matches (
+                source_id INTEGER NOT NULL,
+                export_id INTEGER NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (source_id, export_id)
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_matches_export ON matches (export_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_matches_score ON matches (score)")
+        # Оценки сбрасываются только у файлов, сменивших имя, корень, папку или день изменения
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_match_invalidate
+            AFTER UPDATE OF parent_folder, filename, last_modified, root ON files
+            WHEN old.parent_folder IS NOT new.parent_folder OR old.filename IS NOT new.filename
+                 OR old.root IS NOT new.root
+                 OR {DAY_SQL.format('old.last_modified')} IS NOT {DAY_SQL.format('new.last_modified')}
+            BEGIN
+                UPDATE files SET match_dirty = 1 WHERE id = new.id;
+                DELETE FROM matches WHERE source_id = new.id OR export_id = new.id;
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS files_match_delete
+            AFTER DELETE ON files
+            BEGIN
+                DELETE FROM matches WHERE source_id = old.id OR export_id = old.id;
+            END
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS dirs (
+                path TEXT PRIMARY KEY,
+                parent TEXT,
+                mtime REAL,
+                root TEXT
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs (parent)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_dirs_root ON dirs (root)")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        conn.execute(HISTORY_TABLE_SQL)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_recorded ON file_history (recorded_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_history_file ON file_history (file_id, recorded_at)")
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_history_insert
+            AFTER INSERT ON files
+            BEGIN
+                INSERT INTO file_history (file_id, event, path, parent_folder, filename, new_mtime, size,
+                                          created_by, recorded_at)
+                VALUES (new.id, '{HISTORY_ADDED}', new.path, new.parent_folder, new.filename, new.last_modified,
+                        new.size, new.created_by, {NOW_SQL});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_history_update
+            AFTER UPDATE OF path, last_modified, size ON files
+            WHEN old.path IS NOT new.path OR old.last_modified IS NOT new.last_modified OR old.size IS NOT new.size
+            BEGIN
+                INSERT INTO file_history (file_id, event, path, old_path, parent_folder, filename, old_mtime,
+                                          new_mtime, size, created_by, recorded_at)
+                VALUES (new.id,
+                        CASE WHEN old.path IS NOT new.path THEN '{HISTORY_MOVED}' ELSE '{HISTORY_MODIFIED}' END,
+                        new.path, CASE WHEN old.path IS NOT new.path THEN old.path END, new.parent_folder,
+                        new.filename, old.last_modified, new.last_modified, new.size, new.created_by, {NOW_SQL});
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS files_history_delete
+            AFTER DELETE ON files
+            BEGIN
+                INSERT INTO file_history (file_id, event, path, parent_folder, filename, old_mtime, size,
+                                          created_by, recorded_at)
+                VALUES (old.id, '{HISTORY_DELETED}', old.path, old.parent_folder, old.filename, old.last_modified,
+                        old.size, old.created_by, {NOW_SQL});
+            END
+        ''')
+        # Кэш заголовков IFC и частичных хешей: действителен, пока у файла те же size и mtime
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                partial_hash TEXT,
+                header_timestamp REAL,
+                originating_system TEXT,
+                file_schema TEXT
+            )
+        ''')
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return conn
+
+
+def get_setting(conn, key):
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_setting(conn, key, value):
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+
+
+UPSERT_FILE_SQL = '''
+    INSERT INTO files (parent_folder, path, filename, last_modified, created_by, size, root)
+    VALUES (?, ?, ?, ?, ifnull(?, ''), ?, ?)
+    ON CONFLICT (path) DO UPDATE SET
+        parent_folder = excluded.parent_folder,
+        filename = excluded.filename,
+        last_modified = excluded.last_modified,
+        created_by = excluded.created_by,
+        size = excluded.size,
+        root = excluded.root
+'''
+
+
+def format_mtime(mtime):
+    return datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def upsert_file(conn, parent_folder, path, filename, last_modified, created_by, size=None, root=None):
+    with conn:
+        conn.execute(UPSERT_FILE_SQL, (parent_folder, path, filename, last_modified, created_by, size, root))
+
+
+def insert_files(conn, rows, root=None):
+    # rows: (parent_folder, path, filename, last_modified, created_by, size);
+    # last_modified - mtime в секундах, root - корневая папка всей пачки
+    with conn:
+        conn.executemany(UPSERT_FILE_SQL, (row + (root,) for row in rows))
+
+
+def update_files(conn, rows):
+    # rows: (last_modified, size, id)
+    with conn:
+        conn.executemany("UPDATE files SET last_modified = ?, size = ? WHERE id = ?", rows)
+
+
+def delete_file(conn, path):
+    with conn:
+        conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+
+def apply_file_changes(conn, upserts, deletes, moves=(), root=None):
+    # Изменения от монитора одной транзакцией; upserts - как в insert_files, deletes - пути,
+    # moves - (старый путь, строка как в insert_files). Перемещение меняет путь у той же строки,
+    # id файла сохраняется; если старой строки нет - это обычное добавление.
+    # Удаления идут первыми: путь, удаленный и снова созданный в одной пачке, остается в базе
+    with conn:
+        conn.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in deletes))
+        conn.executemany(UPSERT_FILE_SQL, (row + (root,) for row in upserts))
+        for src, (parent_folder, path, filename, last_modified, created_by, size) in moves:
+            # Переименование поверх существующего файла: старая запись назначения уходит
+            conn.execute("DELETE FROM files WHERE path = ? AND path <> ?", (path, src))
+            cursor = conn.execute('''
+                UPDATE files SET parent_folder = ?, path = ?, filename = ?, last_modified = ?, size = ?, root = ?
+                WHERE path = ?
+            ''', (parent_folder, path, filename, last_modified, size, root, src))
+            if cursor.rowcount == 0:
+                conn.execute(UPSERT_FILE_SQL, (parent_folder, path, filename, last_modified, created_by, size, root))
+
+
+def delete_files(conn, ids):
+    with conn:
+        conn.executemany("DELETE FROM files WHERE id = ?", ((file_id,) for file_id in ids))
+
+
+def claim_root(conn, root):
+    # Записи старых баз без root, лежащие внутри root, переходят к нему
+    prefix = os.path.join(root, "")
+    with conn:
+        for table in ("files", "dirs"):
+            conn.execute(f'''
+                UPDATE {table} SET root = ?
+                WHERE root IS NULL AND (path = ? OR substr(path, 1, length(?)) = ?)
+            ''', (root, root, prefix, prefix))
+
+
+def load_file_signatures(conn, root=None):
+    # path -> (id, size, last_modified) файлов корня root
+    return {path: (file_id, size, last_modified)
+            for file_id, path, size, last_modified
+            in conn.execute("SELECT id, path, size, last_modified FROM files WHERE root IS ?", (root,))}
+
+
+def load_directories(conn, root=None):
+    # path -> (mtime, [подпапки]) папок корня root
+    directories = {}
+    children = {}
+    for path, parent, mtime in conn.execute("SELECT path, parent, mtime FROM dirs WHERE root IS ?", (root,)):
+        directories[path] = mtime
+        children.setdefault(parent, []).append(path)
+    return {path: (mtime, children.get(path, [])) for path, mtime in directories.items()}
+
+
+def load_directory_paths(conn, root=None):
+    return [row[0] for row in conn.execute("SELECT path FROM dirs WHERE root IS ?", (root,))]
+
+
+def save_directories(conn, rows, removed, root=None):
+    # rows: (path, parent, mtime); removed: пути папок, которых больше нет
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO dirs (path, parent, mtime, root) VALUES (?, ?, ?, ?)",
+                         (row + (root,) for row in rows))
+        conn.executemany("DELETE FROM dirs WHERE path = ?", ((path,) for path in removed))
+
+
+def load_dirty_groups(conn):
+    # Группы (корень, папка, день), в которых есть файлы с устаревшими оценками.
+    # Одноименные папки разных корней - разные группы
+    return conn.execute(f'''
+        SELECT DISTINCT root, parent_folder, {DAY_SQL.format('last_modified')} FROM files WHERE match_dirty = 1
+    ''').fetchall()
+
+
+def load_group(conn, root, parent_folder, day):
+    # day - 'YYYY-MM-DD' местного времени; выборка по индексу (parent_folder, last_modified)
+    start = datetime.strptime(day, '%Y-%m-%d')
+    end = start + timedelta(days=1)
+    return conn.execute('''
+        SELECT id, filename, match_dirty FROM files
+        WHERE parent_folder = ? AND last_modified >= ? AND last_modified < ? AND root IS ?
+    ''', (parent_folder, start.timestamp(), end.timestamp(), root)).fetchall()
+
+
+def save_group_matches(conn, dirty_ids, rows):
+    # rows: (source_id, export_id, score); прежние оценки файлов dirty_ids заменяются новыми
+    with conn:
+        conn.executemany("DELETE FROM matches WHERE source_id = ? OR export_id = ?",
+                         ((file_id, file_id) for file_id in dirty_ids))
+        conn.executemany("INSERT OR REPLACE INTO matches (source_id, export_id, score) VALUES (?, ?, ?)", rows)
+        conn.executemany("UPDATE files SET match_dirty = 0 WHERE id = ?", ((file_id,) for file_id in dirty_ids))
+
+
+def reset_matches(conn):
+    with conn:
+        conn.execute("DELETE FROM matches")
+        conn.execute("UPDATE files SET match_dirty = 1")
+
+
+# Сортировки таблицы результатов; каждая заканчивается уникальным столбцом, чтобы ключ
+# (значения этих столбцов) однозначно задавал место строки, и у каждой есть индекс.
+# Равные значения различает id - он есть в любом индексе, так индекс уже и запись дешевле.
+# У created_by мало разных значений, и по id пришлось бы перебирать всех файлов автора - там path
+FILE_SORT_KEYS = {
+    "filename": ("filename", "id"),
+    "parent_folder": ("parent_folder", "last_modified", "id"),
+    "path": ("path",),
+    "last_modified": ("last_modified", "id"),
+    "created_by": ("created_by", "path"),
+}
+
+HIGHLIGHT_ANY = "any"
+HIGHLIGHT_MATCHED = "matched"
+HIGHLIGHT_UNMATCHED = "unmatched"
+
+HIGHLIGHTED_SQL = '''
+    EXISTS (SELECT 1 FROM matches WHERE (source_id = files.id OR export_id = files.id) AND score >= :threshold)
+'''
+
+
+def _files_filter(folder, extension, highlight):
+    clauses = []
+    if folder:
+        clauses.append("parent_folder = :folder")
+    if extension:
+        clauses.append("filename LIKE '%' || :extension")
+    if highlight == HIGHLIGHT_MATCHED:
+        clauses.append(HIGHLIGHTED_SQL)
+    elif highlight == HIGHLIGHT_UNMATCHED:
+        clauses.append("NOT " + HIGHLIGHTED_SQL)
+    return clauses
+
+
+def _where(clauses):
+    return f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+def _keyset(columns, descending, after, backward, inclusive, params):
+    # Страница от ключа строки вместо OFFSET: сравнение ключей идет по индексу сортировки,
+    # поэтому цена не зависит от того, сколько строк до страницы. backward - строки перед after,
+    # ближайшие первыми. Возвращает условие (или None) и ORDER BY
+    reverse = descending != backward
+    order_by = ", ".join(column + (" DESC" if reverse else "") for column in columns)
+    if after is None:
+        return None, order_by
+    operator = ("<" if reverse else ">") + ("=" if inclusive else "")
+    names = [f"key{index}" for index in range(len(columns))]
+    params.update(zip(names, after))
+    return f"({', '.join(columns)}) {operator} ({', '.join(':' + name for name in names)})", order_by
+
+
+def count_files(conn, threshold, folder=None, extension=None, highlight=HIGHLIGHT_ANY):
+    # threshold=None - подсвеченных файлов нет
+    params = {"folder": folder, "extension": extension, "threshold": 101 if threshold is None else threshold}
+    return conn.execute(f"SELECT COUNT(*) FROM files {_where(_files_filter(folder, extension, highlight))}",
+                        params).fetchone()[0]
+
+
+def load_files_page(conn, threshold, limit, sort="parent_folder", descending=False, folder=None, extension=None,
+                    highlight=HIGHLIGHT_ANY, after=None, backward=False, skip=0, inclusive=False):
+    # Строки (id, filename, parent_folder, path, last_modified, created_by, highlighted, *ключ) в порядке таблицы;
+    # ключ - столбцы FILE_SORT_KEYS[sort]. after - ключ строки, после которой (backward - перед которой)
+    # начинается страница, inclusive - вместе с ней. skip пропускает строки через OFFSET -
+    # только для перехода сразу на много строк
+    columns = FILE_SORT_KEYS[sort]
+    params = {"folder": folder, "extension": extension, "threshold": 101 if threshold is None else threshold,
+              "limit": limit, "skip": skip}
+    clauses = _files_filter(folder, extension, highlight)
+    condition, order_by = _keyset(columns, descending, after, backward, inclusive, params)
+    if condition:
+        clauses.append(condition)
+    rows = conn.execute(f'''
+        SELECT id, filename, parent_folder, path, last_modified, created_by, {HIGHLIGHTED_SQL}, {", ".join(columns)}
+        FROM files {_where(clauses)}
+        ORDER BY {order_by}
+        LIMIT :limit OFFSET :skip
+    ''', params).fetchall()
+    return rows[::-1] if backward else rows
+
+
+def list_parent_folders(conn):
+    return [row[0] for row in conn.execute("SELECT DISTINCT parent_folder FROM files ORDER BY parent_folder")]
+
+
+def iter_highlighted_files(conn, threshold):
+    # (filename, parent_folder, path, last_modified, created_by) подсвеченных файлов по папкам
+    return conn.execute(f'''
+        SELECT filename, parent_folder, path, last_modified, created_by FROM files
+        WHERE {HIGHLIGHTED_SQL}
+        ORDER BY parent_folder, last_modified, filename
+    ''', {"threshold": threshold})
+
+
+# Статусы сравнения со старой базой; совпадают с тегами строк таблицы
+COMPARE_NEW = "new"
+COMPARE_CHANGED = "changed"
+COMPARE_MISSING = "missing"
+COMPARE_UNCHANGED = "normal"
+
+# Обе выборки идут по индексу path; результат сортируется и пишется во временную таблицу
+# на стороне SQLite, в Python строки не загружаются. old_files - таблица прежнего состояния
+# со столбцами files: старая база или состояние из журнала
+COMPARE_SQL = f'''
+    CREATE TEMP TABLE compare_results AS
+    SELECT status, filename, parent_folder, path, last_modified, created_by FROM (
+        SELECT CASE
+                   WHEN o.id IS NULL THEN '{COMPARE_NEW}'
+                   WHEN o.last_modified <> f.last_modified THEN '{COMPARE_CHANGED}'
+                   ELSE '{COMPARE_UNCHANGED}'
+               END AS status,
+               f.filename, f.parent_folder, f.path, f.last_modified, f.created_by
+        FROM main.files f LEFT JOIN {{old_files}} o ON o.path = f.path
+        UNION ALL
+        SELECT '{COMPARE_MISSING}', o.filename, o.parent_folder, o.path, o.last_modified, o.created_by
+        FROM {{old_files}} o
+        WHERE NOT EXISTS (SELECT 1 FROM main.files f WHERE f.path = o.path)
+    )
+    ORDER BY parent_folder, last_modified, filename, path
+'''
+
+
+def read_only_uri(db_path):
+    return f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+
+
+# Файлы базы до версии 1: дубликаты путей (остается последняя запись) и last_modified строкой
+LEGACY_OLD_FILES_SQL = f'''
+    (SELECT id, parent_folder, path, filename, {LEGACY_MTIME_SQL} AS last_modified, created_by
+     FROM old.files WHERE id IN (SELECT MAX(id) FROM old.files GROUP BY path))
+'''
+
+
+def compare_with_database(conn, old_db_path):
+    # Сравнивает базу conn со старой базой; результат остается во временной таблице
+    # compare_results этого подключения до следующего сравнения. Возвращает счетчики по статусам.
+    # Старая база открывается только на чтение и не меняется (архив может лежать на папке без права записи),
+    # схема старых версий учитывается в самом запросе. ValueError - базы нет или в ней нет таблицы files
+    try:
+        old_conn = sqlite3.connect(read_only_uri(old_db_path), uri=True)
+        try:
+            version = old_conn.execute("PRAGMA user_version").fetchone()[0]
+            has_files = old_conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'files'").fetchone()
+        finally:
+            old_conn.close()
+    except sqlite3.DatabaseError as e:
+        raise ValueError(f"Не удалось открыть базу {old_db_path}: {e}")
+    if not has_files:
+        raise ValueError(f"В базе {old_db_path} нет таблицы files")
+    conn.execute("ATTACH DATABASE ? AS old", (read_only_uri(old_db_path),))
+    try:
+        with conn:
+            _create_compare_results(conn, "old.files" if version >= 1 else LEGACY_OLD_FILES_SQL)
+    finally:
+        conn.execute("DETACH DATABASE old")
+    return compare_counts(conn)
+
+
+def _create_compare_results(conn, old_files):
+    conn.execute("DROP TABLE IF EXISTS temp.compare_results")
+    conn.execute(COMPARE_SQL.format(old_files=old_files))
+    conn.execute("CREATE INDEX temp.idx_compare_status ON compare_results (status)")
+
+
+def compare_with_history(conn, at):
+    # Как compare_with_database, но прежнее состояние берется из журнала на момент at (секунды)
+    with conn:
+        conn.execute("DROP TABLE IF EXISTS temp.history_state")
+        conn.execute(f"CREATE TEMP TABLE history_state AS {STATE_AS_OF_SQL}", {"at": at})
+        conn.execute("CREATE UNIQUE INDEX temp.idx_history_state_path ON history_state (path)")
+        _create_compare_results(conn, "temp.history_state")
+    return compare_counts(conn)
+
+
+def compare_counts(conn):
+    counts = dict.fromkeys((COMPARE_NEW, COMPARE_CHANGED, COMPARE_MISSING, COMPARE_UNCHANGED), 0)
+    counts.update(conn.execute("SELECT status, COUNT(*) FROM compare_results GROUP BY status"))
+    return counts
+
+
+def load_compare_page(conn, limit, status=None, after=None, backward=False, skip=0, inclusive=False):
+    # Строки (rowid, status, filename, parent_folder, path, last_modified, created_by) в порядке таблицы;
+    # ключ строки - rowid, after, backward, skip, inclusive - как у load_files_page.
+    # rowid идут подряд с 1, поэтому без фильтра по статусу пропуск - сдвиг ключа, а не OFFSET
+    if status is None and skip:
+        if after is None:
+            after = conn.execute("SELECT ifnull(MAX(rowid), 0) + 1 FROM compare_results").fetchone()[0] \
+                if backward else 0
+        after += -skip if backward else skip
+        skip = 0
+    params = {"status": status, "limit": limit, "skip": skip}
+    clauses = ["status = :status"] if status is not None else []
+    condition, order_by = _keyset(("rowid",), False, None if after is None else (after,), backward, inclusive,
+                                  params)
+    if condition:
+        clauses.append(condition)
+    rows = conn.execute(f'''
+        SELECT rowid, * FROM compare_results {_where(clauses)} ORDER BY {order_by} LIMIT :limit OFFSET :skip
+    ''', params).fetchall()
+    return rows[::-1] if backward else rows
+
+
+def iter_compare_results(conn):
+    # Все строки последнего сравнения по порядку, без загрузки в память
+    return conn.execute('''
+        SELECT status, filename, parent_folder, path, last_modified, created_by FROM compare_results ORDER BY rowid
+    ''')
+
+
+# Файлы из пар с оценкой не ниже порога
+MATCHED_FILES_SQL = '''
+    SELECT source_id FROM matches WHERE score >= :threshold
+    UNION
+    SELECT export_id FROM matches WHERE score >= :threshold
+'''
+
+
+def load_unfingerprinted_files(conn, threshold):
+    # (path, size, last_modified) файлов из совпавших пар без действительной записи в fingerprints
+    return conn.execute(f'''
+        SELECT files.path, files.size, files.last_modified FROM files
+        LEFT JOIN fingerprints ON fingerprints.path = files.path
+        WHERE files.id IN ({MATCHED_FILES_SQL})
+          AND (fingerprints.path IS NULL OR fingerprints.size IS NOT files.size
+               OR fingerprints.mtime <> files.last_modified)
+    ''', {"threshold": threshold}).fetchall()
+
+
+def save_fingerprints(conn, rows):
+    # rows: (path, size, mtime, partial_hash, header_timestamp, originating_system, file_schema)
+    with conn:
+        conn.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        conn.execute("DELETE FROM fingerprints WHERE path NOT IN (SELECT path FROM files)")
+
+
+def load_matched_pairs(conn, threshold):
+    # Пары (source path, source mtime, export path, score, header_timestamp, originating_system,
+    # file_schema, partial_hash выгрузки) с сохраненными отпечатками выгрузки, если они действительны
+    return conn.execute('''
+        SELECT source.path, source.last_modified, export.path, matches.score,
+               fingerprints.header_timestamp, fingerprints.originating_system, fingerprints.file_schema,
+               fingerprints.partial_hash
+        FROM matches
+        JOIN files source ON source.id = matches.source_id
+        JOIN files export ON export.id = matches.export_id
+        LEFT JOIN fingerprints ON fingerprints.path = export.path AND fingerprints.size IS export.size
+                               AND fingerprints.mtime = export.last_modified
+        WHERE matches.score >= ?
+        ORDER BY source.parent_folder, source.last_modified, source.filename, matches.score DESC
+    ''', (threshold,))
+
+
+# Состояние на момент :at - последнее событие каждого файла не позже :at, если это не удаление.
+# Столбцы как у files, чтобы состояние можно было сравнивать с текущим
+STATE_AS_OF_SQL = f'''
+    SELECT file_history.file_id AS id, file_history.parent_folder, file_history.path, file_history.filename,
+           file_history.new_mtime AS last_modified, file_history.created_by, file_history.size
+    FROM file_history
+    JOIN (SELECT file_id, MAX(id) AS id FROM file_history WHERE recorded_at <= :at GROUP BY file_id) latest
+        ON latest.id = file_history.id
+    WHERE file_history.event <> '{HISTORY_DELETED}'
+'''
+
+
+def load_state_as_of(conn, at):
+    # Курсор (id, parent_folder, path, filename, last_modified, created_by, size) на момент at
+    return conn.execute(f"{STATE_AS_OF_SQL} ORDER BY parent_folder, last_modified, filename", {"at": at})
+
+
+def load_changes_between(conn, start, end):
+    # Курсор событий журнала, записанных в [start, end): (recorded_at, event, path, old_path,
+    # old_mtime, new_mtime, size); выборка по индексу recorded_at
+    return conn.execute('''
+        SELECT recorded_at, event, path, old_path, old_mtime, new_mtime, size FROM file_history
+        WHERE recorded_at >= ? AND recorded_at < ?
+        ORDER BY recorded_at, id
+    ''', (start, end))
@@ -0,0 +1,160 @@
+import os
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from database import load_unfingerprinted_files, save_fingerprints, load_matched_pairs
+from scanner import DEFAULT_WORKERS
+
+# Заголовок STEP занимает несколько сотен байт; больше этого не читается
+HEADER_BYTES = 64 * 1024
+# Частичный хеш: столько байт из начала, середины и конца файла; файлы меньше трех кусков читаются целиком
+HASH_CHUNK = 1024 * 1024
+
+# Выгрузка устарела, если модель изменена позже штампа времени в FILE_NAME больше чем на столько секунд
+STALE_TOLERANCE_SECONDS = 60
+
+VERIFY_OK = "ok"
+VERIFY_STALE = "stale"
+VERIFY_UNKNOWN = "unknown"
+
+_STEP_ENCODED = re.compile(r"\\X2\\((?:[0-9A-Fa-f]{4})*)\\X0\\|\\X\\([0-9A-Fa-f]{2})|\\\\")
+
+
+def _decode_step_string(value):
+    # Строки STEP: \X2\041F0440\X0\ - UTF-16, \X\E9 - байт latin-1, \\ - обратная косая
+    def replace(match):
+        if match.group(1) is not None:
+            hex_text = match.group(1)
+            return "".join(chr(int(hex_text[i:i + 4], 16)) for i in range(0, len(hex_text), 4))
+        if match.group(2) is not None:
+            return chr(int(match.group(2), 16))
+        return "\\"
+    return _STEP_ENCODED.sub(replace, value)
+
+
+def _parse_step_list(text, pos):
+    # text[pos] == '('; возвращает (значения, позиция после ')').
+    # Строки - str, вложенные списки - list, $ - None, прочее (*, числа, .T.) - как есть
+    items = []
+    pos += 1
+    while pos < len(text):
+        char = text[pos]
+        if char == ")":
+            return items, pos + 1
+        if char in ", \r\n\t":
+            pos += 1
+        elif char == "'":
+            end = pos + 1
+            while True:
+                end = text.index("'", end)
+                if text.startswith("''", end):
+                    end += 2
+                else:
+                    break
+            items.append(_decode_step_string(text[pos + 1:end].replace("''", "'")))
+            pos = end + 1
+        elif char == "(":
+            value, pos = _parse_step_list(text, pos)
+            items.append(value)
+        else:
+            end = pos
+            while end < len(text) and text[end] not in ",)":
+                end += 1
+            token = text[pos:end].strip()
+            items.append(None if token == "$" else token)
+            pos = end
+    raise ValueError("Незакрытый список параметров STEP")
+
+
+def _header_entity(header, name):
+    match = re.search(rf"\b{name}\s*\(", header)
+    if match is None:
+        return None
+    return _parse_step_list(header, match.end() - 1)[0]
+
+
+def parse_ifc_header(data):
+    # data - начало файла IFC. Возвращает (штамп времени FILE_NAME в секундах или None,
+    # originating_system, FILE_SCHEMA через запятую) - None там, где разобрать не удалось
+    header = data.decode("latin-1")
+    end = header.find("ENDSEC;")
+    if end >= 0:
+        header = header[:end]
+    timestamp = originating_system = file_schema = None
+    try:
+        file_name = _header_entity(header, "FILE_NAME")
+    except ValueError:
+        file_name = None
+    if file_name and len(file_name) >= 6:
+        if isinstance(file_name[1], str):
+            try:
+                # Без часового пояса - местное время, как пишут Revit и AutoCAD
+                timestamp = datetime.fromisoformat(file_name[1]).timestamp()
+            except ValueError:
+                pass
+        if isinstance(file_name[5], str):
+            originating_system = file_name[5]
+    try:
+        schema = _header_entity(header, "FILE_SCHEMA")
+    except ValueError:
+        schema = None
+    if schema and isinstance(schema[0], list):
+        file_schema = ",".join(name for name in schema[0] if isinstance(name, str))
+    return timestamp, originating_system, file_schema
+
+
+def partial_hash(file, size):
+    # Размер и куски из начала, середины и конца: чтение по смещениям, файл целиком не читается
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    if size <= 3 * HASH_CHUNK:
+        digest.update(file.read())
+    else:
+        for offset in (0, size // 2 - HASH_CHUNK // 2, size - HASH_CHUNK):
+            file.seek(offset)
+            digest.update(file.read(HASH_CHUNK))
+    return digest.hexdigest()
+
+
+def fingerprint_file(path):
+    # Строка для save_fingerprints или None, если файл недоступен.
+    # size и mtime - прочитанного сейчас файла, а не записанные сканером
+    try:
+        with open(path, "rb") as file:
+            file_stat = os.fstat(file.fileno())
+            header = (None, None, None)
+            if path.lower().endswith(".ifc"):
+                header = parse_ifc_header(file.read(HEADER_BYTES))
+                file.seek(0)
+            file_hash = partial_hash(file, file_stat.st_size)
+    except OSError:
+        return None
+    return (path, file_stat.st_size, file_stat.st_mtime, file_hash) + header
+
+
+def refresh_fingerprints(conn, threshold, workers=DEFAULT_WORKERS):
+    # Читает только файлы совпавших пар, у которых нет отпечатка для текущих size и mtime.
+    # Возвращает число прочитанных файлов
+    paths = [path for path, _, _ in load_unfingerprinted_files(conn, threshold)]
+    if not paths:
+        return 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        rows = [row for row in pool.map(fingerprint_file, paths) if row is not None]
+    save_fingerprints(conn, rows)
+    return len(rows)
+
+
+def verify_matches(conn, threshold, workers=DEFAULT_WORKERS):
+    # Для каждой совпавшей пары: (source path, export path, score, статус, originating_system, file_schema,
+    # partial_hash выгрузки). stale - модель изменена позже, чем выгрузка записана по ее заголовку
+    refresh_fingerprints(conn, threshold, workers)
+    for (source_path, source_mtime, export_path, score, header_timestamp, originating_system, file_schema,
+         export_hash) in load_matched_pairs(conn, threshold):
+        if header_timestamp is None:
+            status = VERIFY_UNKNOWN
+        elif source_mtime > header_timestamp + STALE_TOLERANCE_SECONDS:
+            status = VERIFY_STALE
+        else:
+            status = VERIFY_OK
+        yield source_path, export_path, score, status, originating_system, file_schema, export_hash
@@ -1,213 +1,207 @@
 import os
-import sqlite3
+import queue
 from datetime import datetime
-import getpass
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
-from rapidfuzz import fuzz
-from reportlab.lib import colors
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from reportlab.lib.pagesizes import letter, landscape
-import openpyxl
-from openpyxl.styles import Font
-from tkinter import Tk, filedialog, Label, Button, Entry, messagebox, IntVar, Checkbutton, ttk, TclError
+from tkinter import (Tk, filedialog, Label, Button, Entry, messagebox, IntVar, StringVar, Checkbutton, Frame, ttk,
+                     TclError)
+
+from database import (open_database, new_database_path, find_latest_database, list_parent_folders,
+                      compare_with_database, HIGHLIGHT_ANY, HIGHLIGHT_MATCHED,
+                      HIGHLIGHT_UNMATCHED, COMPARE_NEW, COMPARE_CHANGED, COMPARE_MISSING, COMPARE_UNCHANGED)
+from scanner import get_file_extensions, scan_to_database
+from matcher import refresh_matches
+from monitor import EventPipeline, QueueingEventHandler
+from reports import (count_report_rows, iter_report_rows, report_file_name, write_pdf_report, write_excel_report,
+                     write_csv_report)
+from results_view import ResultsView, FilesSource, CompareSource
+from metrics import metrics, write_metrics, rate, mean_seconds, profiled, PROFILE_ENV_VAR
+from tasks import BackgroundTask
 
 conn = None
-cursor = None
+current_db_path = None
+# Отдельное подключение с результатом последнего сравнения: временная таблица видна только ему
+compare_conn = None
+
+# Наблюдатель watchdog и поток записи его событий в базу
+observer = None
+event_pipeline = None
+monitor_poll_id = None
+MONITOR_POLL_MS = 250
+
+# Фоновая операция (сканирование, сравнение, отчет) - не больше одной за раз
+current_task = None
+task_poll_id = None
+TASK_POLL_MS = 100
+# Сканирование из окна пишет пачки меньше обычных, чтобы файлы появлялись в таблице по ходу обхода
+GUI_SCAN_BATCH_SIZE = 1000
+
+# Строка метрик внизу окна: скорости считаются между соседними снимками
+METRICS_POLL_MS = 1000
+last_metrics = None
+
+# Порог, по которому пересчитаны оценки схожести в базе. Оценки считаются только в фоновых потоках
+# (сканирование, подсветка, отчет, монитор) - поток монитора читает порог отсюда, а не из Tk
+applied_threshold = None
+
+# Сортировка таблицы: ключ из FILE_SORT_KEYS и направление
+sort_column = "parent_folder"
+sort_descending = False
+
+# Фильтр подсветки: подпись в списке -> значение для запроса
+HIGHLIGHT_FILTERS = {"Все": HIGHLIGHT_ANY, "Совпадения": HIGHLIGHT_MATCHED, "Без совпадений": HIGHLIGHT_UNMATCHED}
+EXTENSION_FILTERS = ("", ".rvt", ".ifc", ".dwg")
 
 
 def connect_to_database(db_path):
-    global conn, cursor
+    global conn, current_db_path, applied_threshold
+    stop_monitoring()
+    close_compare()
     if conn:
         conn.close()
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS files (
-            id INTEGER PRIMARY KEY,
-            parent_folder TEXT,
-            path TEXT,
-            filename TEXT,
-            last_modified TEXT,
-            created_by TEXT
-        )
-    ''')
-    conn.commit()
+    conn = open_database(db_path)
+    current_db_path = db_path
+    # Оценки новой базы еще не пересчитаны по порогу из окна
+    applied_threshold = None
     messagebox.showinfo("Информация", "Подключение к базе данных успешно!")
 
 
-def update_file_in_db(parent_folder, path, filename, last_modified, created_by):
-    cursor.execute('''
-        INSERT OR REPLACE INTO files (parent_folder, path, filename, last_modified, created_by)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (parent_folder, path, filename, last_modified, created_by))
-    conn.commit()
-    update_table()
+def current_threshold():
+    try:
+        return similarity_threshold.get()
+    except TclError:
+        return None
 
 
-def are_filenames_similar(name1, name2, threshold=80):
-    base1, _ = os.path.splitext(name1)
-    base2, _ = os.path.splitext(name2)
-    similarity = fuzz.ratio(base1, base2)
-    return similarity >= threshold
+def highlight_in_background(task, db_path, threshold):
+    # Пересчитываются только устаревшие оценки; при пороге ниже сохраненного - все
+    highlight_conn = open_database(db_path)
+    try:
+        return refresh_matches(highlight_conn, threshold)
+    finally:
+        highlight_conn.close()
 
 
 def apply_highlighting():
-    for row in tree.get_children():
-        filename, parent_folder, path, last_modified, _ = tree.item(row, "values")
-        tag = 'rvt' if filename.endswith('.rvt') else 'ifc' if filename.endswith('.ifc') else 'dwg'
+    # Оценки схожести пересчитываются в фоне, таблица потом перечитывает только видимое окно строк
+    threshold = current_threshold()
+    if threshold is None or not conn:
+        show_highlighting(threshold)
+        return
+    start_task(BackgroundTask(highlight_in_background, current_db_path, threshold,
+                              on_done=lambda groups: show_highlighting(threshold),
+                              on_cancelled=lambda result: status_label.config(text="Подсветка отменена"),
+                              on_failed=lambda error: task_failed("Не удалось пересчитать совпадения", error)),
+               "Поиск совпадений...")
 
-        # Applying basic highlighting
-        tree.item(row, tags=(tag,))
 
-    try:
-        threshold = similarity_threshold.get()
-    except TclError:
-        return
+def show_highlighting(threshold):
+    global applied_threshold
+    with metrics.timed("ui_highlighting"):
+        applied_threshold = threshold
+        status_label.config(text="")
+        if isinstance(results_view.source, FilesSource):
+            results_view.source.threshold = threshold
+        results_view.refresh()
+
 
-    rows = cursor.execute("SELECT * FROM files").fetchall()
-    file_groups = {}
-    for row in rows:
-        parent_folder, path, filename, last_modified, created_by = row[1:]
-        key = (parent_folder, last_modified[:10])
-        if key not in file_groups:
-            file_groups[key] = []
-        file_groups[key].append(row)
-
-    # Checking for similarity and applying highlight if needed
-    for group in file_groups.values():
-        for i, file1 in enumerate(group):
-            for j, file2 in enumerate(group):
-                if i < j:
-                    if are_filenames_similar(file1[3], file2[3], threshold) and file1[4][:10] == file2[4][:10]:
-                        if (file1[3].endswith(".rvt") and file2[3].endswith(".ifc")) or \
-                                (file1[3].endswith(".ifc") and file2[3].endswith(".rvt")) or \
-                                (file1[3].endswith(".dwg") and file2[3].endswith(".ifc")) or \
-                                (file1[3].endswith(".ifc") and file2[3].endswith(".dwg")):
-                            for f in (file1, file2):
-                                for row in tree.get_children():
-                                    if tree.item(row, "values")[2] == f[2]:
-                                        current_tags = tree.item(row, "tags")
-                                        tree.item(row, tags=current_tags + ("highlight",))
+def refresh_monitor_matches(monitor_conn):
+    # Поток монитора: оценки новых файлов считаются до того, как пачка попадет в главный поток
+    threshold = applied_threshold
+    if threshold is not None:
+        refresh_matches(monitor_conn, threshold)
 
 
 def update_table():
-    for row in tree.get_children():
-        tree.delete(row)
-    rows = cursor.execute("SELECT filename, parent_folder, path, last_modified, created_by FROM files").fetchall()
-    rows = sorted(rows, key=lambda x: (x[1], x[3], x[0]))
-    for row in rows:
-        filename, parent_folder, path, last_modified, created_by = row
-        tag = 'rvt' if filename.endswith('.rvt') else ('dwg' if filename.endswith('.dwg') else 'ifc')
-        tree.insert('', 'end', values=row, tags=(tag,))
-    apply_highlighting()
+    # Только чтение: подсветка - по порогу, по которому фоновая операция уже посчитала оценки,
+    # а не по числу, которое сейчас введено в поле
+    with metrics.timed("ui_update_table"):
+        threshold = applied_threshold
+        folder_filter["values"] = [""] + list_parent_folders(conn)
+        results_view.set_source(FilesSource(conn, threshold, sort_column, sort_descending,
+                                            folder=folder_filter.get() or None,
+                                            extension=extension_filter.get() or None,
+                                            highlight=HIGHLIGHT_FILTERS[highlight_filter.get()]))
+
+
+def apply_filters(event=None):
+    if conn:
+        update_table()
+
+
+def sort_by(column):
+    # Повторный щелчок по тому же заголовку меняет направление
+    global sort_column, sort_descending
+    sort_descending = not sort_descending if column == sort_column else False
+    sort_column = column
+    if conn and isinstance(results_view.source, FilesSource):
+        update_table()
 
 
-def wrap_text(text, max_width, font, font_size, pdf_canvas):
-    words = text.split(' ')
-    lines = []
-    current_line = words[0]
-    for word in words[1:]:
-        if pdf_canvas.stringWidth(current_line + ' ' + word, font, font_size) < max_width:
-            current_line += ' ' + word
-        else:
-            lines.append(current_line)
-            current_line = word
-    lines.append(current_line)
-    return lines
+def can_report(empty_message):
+    # Здесь только порог и подключение; есть ли совпадения, узнает фоновая операция после пересчета оценок
+    if current_threshold() is None or not conn:
+        messagebox.showwarning("Предупреждение", empty_message)
+        return False
+    return True
 
 
 def create_pdf_report():
-    highlighted_files = []
-    for row in tree.get_children():
-        item = tree.item(row)
-        if "highlight" in item["tags"]:
-            highlighted_files.append(item["values"])
-    if not highlighted_files:
-        messagebox.showwarning("Предупреждение", "Нет совпадающих файлов для генерации отчета.")
+    empty_message = "Нет совпадающих файлов для генерации отчета."
+    if not can_report(empty_message):
         return
     save_folder = filedialog.askdirectory()
     if not save_folder:
         return
     root_folder_name = os.path.basename(folder_path.get())
-    report_name = f"{root_folder_name}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.pdf"
-    pdf_path = os.path.join(save_folder, report_name)
-    font_path = r"C:\Windows\Fonts\arial.ttf"
-    pdfmetrics.registerFont(TTFont('Arial', font_path))
-    c = canvas.Canvas(pdf_path, pagesize=landscape(letter))
-    width, height = landscape(letter)
-    c.setFont("Arial", 14)
-    c.drawString(30, height - 30, f"Отчет по файлам в '{root_folder_name}'")
-    c.setFont("Arial", 10)
-    c.drawString(30, height - 50, f"Сгенерировано: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    y_position = height - 70
-    files_by_parent_folder = {}
-    for file in highlighted_files:
-        filename, parent_folder, path, last_modified, created_by = file
-        if parent_folder not in files_by_parent_folder:
-            files_by_parent_folder[parent_folder] = []
-        files_by_parent_folder[parent_folder].append(file)
-    for parent_folder, files in files_by_parent_folder.items():
-        c.setFont("Arial", 12)
-        c.drawString(30, y_position, f"Папка: {parent_folder}")
-        y_position -= 20
-        c.setFont("Arial", 10)
-        c.drawString(30, y_position, "Имя файла")
-        c.drawString(200, y_position, "Последнее изм.")
-        c.drawString(300, y_position, "Путь")
-        y_position -= 20
-        for file in files:
-            filename, parent_folder, path, last_modified, created_by = file
-            c.drawString(30, y_position, filename)
-            c.drawString(200, y_position, last_modified)
-            path_max_width = width - 440
-            path_lines = wrap_text(path, path_max_width, "Arial", 10, c)
-            for line in path_lines:
-                c.drawString(300, y_position, line)
-                y_position -= 12
-            if len(path_lines) == 1 and c.stringWidth(path_lines[0], "Arial", 10) <= path_max_width:
-                c.setFillColor(colors.blue)
-                c.linkURL(f"file://{path}", (300, y_position + 12, width - 30, y_position + 24), relative=0)
-                c.setFillColor(colors.black)
-            y_position -= 8
-            if y_position < 40:
-                c.showPage()
-                c.setFont("Arial", 10)
-                y_position = height - 30
-                c.drawString(30, y_position, "Имя файла")
-                c.drawString(200, y_position, "Последнее изм.")
-                c.drawString(300, y_position, "Путь")
-                y_position -= 20
-    c.save()
-    messagebox.showinfo("Информация", f"Отчет сохранен в {pdf_path}")
+    pdf_path = os.path.join(save_folder, report_file_name(root_folder_name, datetime.now()))
+    start_report(lambda path, rows: write_pdf_report(path, root_folder_name, rows), pdf_path, empty_message)
 
 
 def export_to_excel():
-    highlighted_files = []
-    for row in tree.get_children():
-        item = tree.item(row)
-        if "highlight" in item["tags"]:
-            highlighted_files.append(item["values"])
-    if not highlighted_files:
-        messagebox.showwarning("Предупреждение", "Нет выделенных файлов для экспорта.")
+    empty_message = "Нет выделенных файлов для экспорта."
+    if not can_report(empty_message):
         return
-    save_path = filedialog.asksaveasfilename(defaultextension=".xlsx", filetypes=[("Excel Files", "*.xlsx")])
+    save_path = filedialog.asksaveasfilename(defaultextension=".xlsx",
+                                             filetypes=[("Excel Files", "*.xlsx"), ("CSV Files", "*.csv")])
     if not save_path:
         return
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Отчет по файлам"
-    headers = ["Имя файла", "Родительская Папка", "Путь", "Последнее Изменение", "Создано"]
-    sheet.append(headers)
-    for header in headers:
-        cell = sheet[f'{chr(65 + headers.index(header))}1']
-        cell.font = Font(bold=True)
-    for file in highlighted_files:
-        sheet.append(file)
-    workbook.save(save_path)
-    messagebox.showinfo("Информация", f"Excel отчет сохранен в {save_path}")
+    start_report(write_csv_report if save_path.lower().endswith(".csv") else write_excel_report, save_path,
+                 empty_message)
+
+
+def write_report_in_background(task, db_path, threshold, writer, save_path):
+    # Фоновый поток со своим подключением; недописанный файл при отмене или ошибке удаляется.
+    # Без совпадающих файлов отчет не пишется и возвращается None
+    report_conn = open_database(db_path)
+    try:
+        if not count_report_rows(report_conn, threshold):
+            return None
+        task.check()
+        return writer(save_path, task.track(iter_report_rows(report_conn, threshold)))
+    except BaseException:
+        if os.path.exists(save_path):
+            os.remove(save_path)
+        raise
+    finally:
+        report_conn.close()
+
+
+def start_report(writer, save_path, empty_message):
+    start_task(BackgroundTask(write_report_in_background, current_db_path, current_threshold(), writer, save_path,
+                              on_progress=lambda count: status_label.config(text=f"Записано строк: {count}"),
+                              on_done=lambda count: report_saved(save_path, count, empty_message),
+                              on_cancelled=lambda result: status_label.config(text="Отчет отменен"),
+                              on_failed=lambda error: task_failed("Не удалось сохранить отчет", error)),
+               "Запись отчета...")
+
+
+def report_saved(save_path, count, empty_message):
+    if count is None:
+        status_label.config(text="")
+        messagebox.showwarning("Предупреждение", empty_message)
+        return
+    status_label.config(text=f"Отчет сохранен, строк: {count}")
+    messagebox.showinfo("Информация", f"Отчет сохранен в {save_path}")
 
 
 def copy_path():
@@ -221,49 +215,166 @@ def copy_path():
     messagebox.showinfo("Информация", f"Путь скопирован в буфер обмена:\n{path}")
 
 
-def scan_work_folders(root_folder):
-    file_extensions = []
-    if monitor_rvt_ifc.get():
-        file_extensions.extend(['.rvt', '.ifc'])
-    if monitor_dwg_ifc.get():
-        file_extensions.extend(['.dwg', '.ifc'])
-    for dirpath, dirnames, filenames in os.walk(root_folder):
-        if os.path.basename(dirpath) == "Работа":
-            parent_folder = os.path.basename(os.path.dirname(dirpath))
-            for filename in filenames:
-                if any(filename.endswith(ext) for ext in file_extensions):
-                    file_path = os.path.join(dirpath, filename)
-                    last_modified = datetime.fromtimestamp(os.path.getmtime(file_path)).strftime('%Y-%m-%d %H:%M:%S')
-                    created_by = getpass.getuser()
-                    update_file_in_db(parent_folder, file_path, filename, last_modified, created_by)
-
-
-class FileMonitorHandler(FileSystemEventHandler):
-    def process_file(self, event):
-        file_extensions = []
-        if monitor_rvt_ifc.get():
-            file_extensions.extend(['.rvt', '.ifc'])
-        if monitor_dwg_ifc.get():
-            file_extensions.extend(['.dwg', '.ifc'])
-        if not event.is_directory:
-            filename = os.path.basename(event.src_path)
-            parent_folder = os.path.basename(os.path.dirname(os.path.dirname(event.src_path)))
-            if any(filename.endswith(ext) for ext in file_extensions) and "Работа" in os.path.dirname(event.src_path):
-                last_modified = datetime.fromtimestamp(os.path.getmtime(event.src_path)).strftime('%Y-%m-%d %H:%M:%S')
-                created_by = getpass.getuser()
-                update_file_in_db(parent_folder, event.src_path, filename, last_modified, created_by)
-
-    def on_modified(self, event):
-        self.process_file(event)
-
-    def on_created(self, event):
-        self.process_file(event)
-
-    def on_deleted(self, event):
-        if not event.is_directory:
-            cursor.execute("DELETE FROM files WHERE path = ?", (event.src_path,))
-            conn.commit()
-            update_table()
+def format_metrics(current, previous):
+    elapsed = current["uptime_seconds"] - previous["uptime_seconds"]
+    parts = [f"файлов/с: {rate(current, previous, 'scan_files', elapsed):.0f}",
+             f"событий/с: {rate(current, previous, 'monitor_events', elapsed):.0f}",
+             f"очередь: {current['gauges'].get('monitor_queue_depth', 0)}",
+             f"сравнений/с: {rate(current, previous, 'match_comparisons', elapsed):.0f}"]
+    for timing, caption in (("db_write", "запись в БД"), ("table_refresh", "таблица")):
+        seconds = mean_seconds(current, previous, timing)
+        if seconds is not None:
+            parts.append(f"{caption}: {seconds * 1000:.0f} мс")
+    return ", ".join(parts)
+
+
+def poll_metrics():
+    global last_metrics
+    current = metrics.snapshot()
+    metrics_label.config(text=format_metrics(current, last_metrics or current))
+    last_metrics = current
+    root.after(METRICS_POLL_MS, poll_metrics)
+
+
+def export_metrics():
+    save_path = filedialog.asksaveasfilename(defaultextension=".prom",
+                                             filetypes=[("Prometheus", "*.prom"), ("JSON", "*.json")])
+    if not save_path:
+        return
+    write_metrics(save_path)
+    messagebox.showinfo("Информация", f"Метрики сохранены в {save_path}")
+
+
+def start_task(task, caption):
+    global current_task, task_poll_id
+    current_task = task
+    for button in (start_button, compare_button, pdf_button, excel_button, apply_button):
+        button.config(state='disabled')
+    cancel_button.config(state='normal')
+    status_label.config(text=caption)
+    task.start()
+    task_poll_id = root.after(TASK_POLL_MS, poll_task)
+
+
+def poll_task():
+    # Главный поток: обработчики фоновой операции вызываются только отсюда
+    global current_task, task_poll_id
+    if not current_task.dispatch():
+        task_poll_id = root.after(TASK_POLL_MS, poll_task)
+        return
+    current_task = None
+    task_poll_id = None
+    for button in (start_button, pdf_button, excel_button, apply_button):
+        button.config(state='normal')
+    toggle_compare_mode()
+    cancel_button.config(state='disabled')
+
+
+def cancel_task():
+    if current_task is not None:
+        current_task.cancel()
+        status_label.config(text="Отмена...")
+
+
+def task_failed(message, error):
+    status_label.config(text="")
+    messagebox.showerror("Ошибка", f"{message}: {error}")
+
+
+def show_scan_progress(count):
+    # Записанные пачки уже в базе: таблица показывает их, пока обход продолжается
+    status_label.config(text=f"Найдено файлов: {count}")
+    results_view.refresh()
+
+
+def scan_in_background(task, db_path, root_folder, file_extensions, incremental, threshold):
+    # Оценки схожести новых файлов считаются здесь же, после обхода
+    scan_conn = open_database(db_path)
+    try:
+        count = scan_to_database(scan_conn, root_folder, file_extensions, batch_size=GUI_SCAN_BATCH_SIZE,
+                                 progress=task.report, incremental=incremental, cancelled=task.is_cancelled)
+        if threshold is not None and not task.is_cancelled():
+            refresh_matches(scan_conn, threshold)
+        return count
+    finally:
+        scan_conn.close()
+
+
+def scan_work_folders(root_folder, file_extensions, incremental=False, on_done=None):
+    threshold = current_threshold()
+
+    def scan_done(count):
+        global applied_threshold
+        applied_threshold = threshold
+        status_label.config(text=f"Сканирование завершено, файлов: {count}")
+        update_table()
+        if on_done:
+            on_done()
+
+    def scan_cancelled(count):
+        # Записанное до отмены остается в базе; наблюдение за папкой не запускается
+        update_table()
+        status_label.config(text=f"Сканирование прервано, записано файлов: {count or 0}")
+
+    update_table()
+    start_task(BackgroundTask(scan_in_background, current_db_path, root_folder, file_extensions, incremental,
+                              threshold, on_progress=show_scan_progress, on_done=scan_done, on_cancelled=scan_cancelled,
+                              on_failed=lambda error: task_failed("Не удалось просканировать папку", error)),
+               "Сканирование...")
+
+
+def poll_monitor_batches():
+    # Главный поток: забирает записанные пачки событий и один раз обновляет таблицу
+    global monitor_poll_id
+    changed = False
+    while True:
+        try:
+            batch = event_pipeline.batches.get_nowait()
+        except queue.Empty:
+            break
+        if batch.error is not None:
+            # Незаписанная пачка повторяется в потоке монитора, окно с ошибкой на каждый повтор не нужно
+            status_label.config(text=f"Ошибка записи изменений файлов: {batch.error}")
+        if batch.upserted or batch.deleted:
+            changed = True
+    if changed:
+        # Оценки пачки уже пересчитаны в потоке монитора
+        results_view.refresh()
+    monitor_poll_id = root.after(MONITOR_POLL_MS, poll_monitor_batches)
+
+
+def stop_monitoring():
+    global observer, event_pipeline, monitor_poll_id
+    if monitor_poll_id is not None:
+        root.after_cancel(monitor_poll_id)
+        monitor_poll_id = None
+    if observer is not None:
+        observer.stop()
+        observer.join()
+        observer = None
+    if event_pipeline is not None:
+        event_pipeline.stop()
+        event_pipeline = None
+
+
+def close_compare():
+    global compare_conn
+    if compare_conn is not None:
+        if isinstance(results_view.source, CompareSource):
+            results_view.set_source(None)
+        compare_conn.close()
+        compare_conn = None
+
+
+def close_app():
+    if task_poll_id is not None:
+        root.after_cancel(task_poll_id)
+    if current_task is not None:
+        current_task.cancel()
+        current_task.join()
+    stop_monitoring()
+    close_compare()
+    root.destroy()
 
 
 def select_folder():
@@ -295,6 +406,7 @@ def start_monitoring():
             return
         connect_to_database(existing_db)
         update_table()
+        apply_highlighting()
     else:
         path = folder_path.get()
         db_folder = db_folder_path.get()
@@ -306,18 +418,34 @@ def start_monitoring():
             return
 
         folder_name = os.path.basename(path)
-        db_name = f"BD_{folder_name}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.db"
-        db_path = os.path.join(db_folder, db_name)
-
-        # Создание новой базы данных
+        db_path = None
+        if incremental_scan.get():
+            # Дополняем последнюю базу этой папки вместо полного пересканирования
+            db_path = find_latest_database(db_folder, folder_name)
+        incremental = db_path is not None
+        if not incremental:
+            # Создание новой базы данных
+            db_path = new_database_path(db_folder, folder_name, datetime.now())
         connect_to_database(db_path)
 
-        # Запуск сканирования и наблюдения
-        scan_work_folders(path)
-        event_handler = FileMonitorHandler()
-        observer = Observer()
-        observer.schedule(event_handler, path=path, recursive=True)
-        observer.start()
+        # Сканирование в фоне, наблюдение - после его завершения.
+        # Пути событий должны совпадать с путями сканера: от того же абсолютного корня
+        file_extensions = get_file_extensions(monitor_rvt_ifc.get(), monitor_dwg_ifc.get())
+        root_folder = os.path.abspath(path)
+        scan_work_folders(root_folder, file_extensions, incremental,
+                          on_done=lambda: start_watching(root_folder, file_extensions))
+
+
+def start_watching(root_folder, file_extensions):
+    global observer, event_pipeline, monitor_poll_id
+    event_pipeline = EventPipeline(current_db_path, file_extensions, root=root_folder,
+                                   after_write=refresh_monitor_matches)
+    event_pipeline.start()
+    observer = Observer()
+    observer.schedule(QueueingEventHandler(event_pipeline.events, file_extensions), path=root_folder,
+                      recursive=True)
+    observer.start()
+    monitor_poll_id = root.after(MONITOR_POLL_MS, poll_monitor_batches)
 
 
 def toggle_db_mode():
@@ -326,8 +454,7 @@ def toggle_db_mode():
         db_folder_button.config(state='disabled')
         existing_db_button.config(state='normal')
         old_db_path.config(state='normal')
-        for row in tree.get_children():
-            tree.delete(row)
+        results_view.set_source(None)
     else:
         folder_button.config(state='normal')
         db_folder_button.config(state='normal')
@@ -338,179 +465,209 @@ def toggle_db_mode():
 def toggle_compare_mode():
     if compare_with_old.get():
         existing_db_button.config(state='normal')
+        old_db_path.config(state='normal')
         compare_button.config(state='normal')
-    else:
+    elif not use_existing_db.get():
         existing_db_button.config(state='disabled')
+        old_db_path.config(state='disabled')
+        compare_button.config(state='disabled')
+    else:
         compare_button.config(state='disabled')
 
 
-def compare_databases():
-    path = folder_path.get()
-    db_folder = db_folder_path.get()
-    if not path:
-        messagebox.showerror("Ошибка", "Пожалуйста, выберите папку для мониторинга.")
-        return
-    if not db_folder:
-        messagebox.showerror("Ошибка", "Пожалуйста, выберите папку для сохранения базы данных.")
-        return
-
-    folder_name = os.path.basename(path)
-    db_name = f"BD_{folder_name}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.db"
-    db_path = os.path.join(db_folder, db_name)
+def compare_in_background(task, compare_db_conn, old_db_path_value):
+    return compare_with_database(compare_db_conn, old_db_path_value)
 
-    # Создание и подключение к новой базе данных
-    connect_to_database(db_path)
 
+def compare_databases():
+    # Сравнивается текущая база (открытая мониторингом или выбранная) со старой
+    if not conn:
+        messagebox.showerror("Ошибка", "Сначала запустите мониторинг, чтобы было с чем сравнивать.")
+        return
     old_db_path_value = old_db_path.get()
     if not old_db_path_value:
         messagebox.showerror("Ошибка", "Пожалуйста, выберите старую базу данных для сравнения.")
         return
+    if os.path.abspath(old_db_path_value) == os.path.abspath(current_db_path):
+        messagebox.showerror("Ошибка", "Выбрана текущая база данных, сравнивать не с чем.")
+        return
 
-    try:
-        # Подключаемся к старой базе данных
-        old_conn = sqlite3.connect(old_db_path_value)
-        old_cursor = old_conn.cursor()
-        old_files = old_cursor.execute("SELECT filename, parent_folder, path, last_modified FROM files").fetchall()
-        old_conn.close()
-
-        # Получаем данные из текущей (новой) базы данных
-        new_files = cursor.execute("SELECT filename, parent_folder, path, last_modified FROM files").fetchall()
-
-        # Создаем словари для удобного сравнения
-        old_files_dict = {file[2]: file for file in old_files}
-        new_files_dict = {file[2]: file for file in new_files}
-
-        # Очищаем древовидный виджет
-        for row in tree.get_children():
-            tree.delete(row)
-
-        # Итерируем по новым файлам и определяем их статус
-        for new_path, new_file in new_files_dict.items():
-            if new_path in old_files_dict:
-                old_file = old_files_dict[new_path]
-                # Обновлено: Проверяем, изменилось ли время последнего изменения
-                if old_file[3] != new_file[3]:
-                    tag = "changed"
-                else:
-                    tag = "normal"
-            else:
-                tag = "new"
-
-            tree.insert('', 'end', values=new_file, tags=(tag,))
-
-        # Итерируем по старым файлам, которых нет в новых
-        for old_path, old_file in old_files_dict.items():
-            if old_path not in new_files_dict:
-                tree.insert('', 'end', values=old_file, tags=("missing",))
-
-        # Настройка тегов для отображения изменений
-        tree.tag_configure("changed", background="orange")  # Измененные файлы
-        tree.tag_configure("new", background="lightgreen")  # Новые файлы
-        tree.tag_configure("missing", background="red")  # Удаленные файлы
-
-    except Exception as e:
-        messagebox.showerror("Ошибка", f"Не удалось выполнить сравнение: {e}")
+    # Сравнение идет в фоне на своем подключении; оно же потом читает страницы результата в главном потоке
+    new_compare_conn = open_database(current_db_path, check_same_thread=False)
+
+    def compare_done(counts):
+        global compare_conn
+        close_compare()
+        compare_conn = new_compare_conn
+        results_view.set_source(CompareSource(compare_conn, counts))
+        status_label.config(text=f"Новых: {counts[COMPARE_NEW]}, изменено: {counts[COMPARE_CHANGED]}, "
+                                 f"удалено: {counts[COMPARE_MISSING]}, без изменений: {counts[COMPARE_UNCHANGED]}")
+
+    def compare_cancelled(result):
+        new_compare_conn.close()
+        status_label.config(text="Сравнение отменено")
+
+    def compare_failed(error):
+        new_compare_conn.close()
+        task_failed("Не удалось выполнить сравнение", error)
+
+    task = BackgroundTask(compare_in_background, new_compare_conn, old_db_path_value,
+                          on_done=compare_done, on_cancelled=compare_cancelled, on_failed=compare_failed)
+    # Долгий запрос сравнения прерывается сразу, а не по его окончании
+    task.interrupt = new_compare_conn.interrupt
+    start_task(task, "Сравнение баз...")
 
 
 def update_highlighting():
     apply_highlighting()
 
 
-root = Tk()
-root.title("Ищем актуальные IFC")
+if __name__ == "__main__":
+    # Интерфейс строится только при запуске программы; без Tk работают cli.py и модули ядра
+    root = Tk()
+    root.title("Ищем актуальные IFC")
+
+    use_existing_db = IntVar(value=0)
+    use_existing_checkbox = Checkbutton(root, text="Использовать старую БД", variable=use_existing_db,
+                                        command=toggle_db_mode)
+    use_existing_checkbox.grid(row=0, column=0, padx=10, pady=10, sticky="w")
 
-use_existing_db = IntVar(value=0)
-use_existing_checkbox = Checkbutton(root, text="Использовать старую БД", variable=use_existing_db,
-                                    command=toggle_db_mode)
-use_existing_checkbox.grid(row=0, column=0, padx=10, pady=10, sticky="w")
+    compare_with_old = IntVar(value=0)
+    compare_with_checkbox = Checkbutton(root, text="Сравнить со старой БД", variable=compare_with_old,
+                                        command=toggle_compare_mode)
+    compare_with_checkbox.grid(row=0, column=1, padx=10, pady=10, sticky="w")
 
-compare_with_old = IntVar(value=0)
-compare_with_checkbox = Checkbutton(root, text="Сравнить со старой БД", variable=compare_with_old,
-                                    command=toggle_compare_mode)
-compare_with_checkbox.grid(row=0, column=1, padx=10, pady=10, sticky="w")
+    folder_label = Label(root, text="Выбрать папку:")
+    folder_label.grid(row=1, column=0, padx=10, pady=10)
 
-folder_label = Label(root, text="Выбрать папку:")
-folder_label.grid(row=1, column=0, padx=10, pady=10)
+    folder_path = Entry(root, width=50)
+    folder_path.grid(row=1, column=1, padx=10, pady=10)
 
-folder_path = Entry(root, width=50)
-folder_path.grid(row=1, column=1, padx=10, pady=10)
+    folder_button = Button(root, text="Выбрать", command=select_folder)
+    folder_button.grid(row=1, column=2, padx=10, pady=10)
 
-folder_button = Button(root, text="Выбрать", command=select_folder)
-folder_button.grid(row=1, column=2, padx=10, pady=10)
+    db_folder_label = Label(root, text="Выбрать папку для базы данных:")
+    db_folder_label.grid(row=2, column=0, padx=10, pady=10)
 
-db_folder_label = Label(root, text="Выбрать папку для базы данных:")
-db_folder_label.grid(row=2, column=0, padx=10, pady=10)
+    db_folder_path = Entry(root, width=50)
+    db_folder_path.grid(row=2, column=1, padx=10, pady=10)
 
-db_folder_path = Entry(root, width=50)
-db_folder_path.grid(row=2, column=1, padx=10, pady=10)
+    db_folder_button = Button(root, text="Выбрать", command=select_db_folder)
+    db_folder_button.grid(row=2, column=2, padx=10, pady=10)
 
-db_folder_button = Button(root, text="Выбрать", command=select_db_folder)
-db_folder_button.grid(row=2, column=2, padx=10, pady=10)
+    existing_db_label = Label(root, text="Выбрать файл старой базы данных:")
+    existing_db_label.grid(row=3, column=0, padx=10, pady=10)
 
-existing_db_label = Label(root, text="Выбрать файл старой базы данных:")
-existing_db_label.grid(row=3, column=0, padx=10, pady=10)
+    old_db_path = Entry(root, width=50, state='disabled')
+    old_db_path.grid(row=3, column=1, padx=10, pady=10)
 
-old_db_path = Entry(root, width=50, state='disabled')
-old_db_path.grid(row=3, column=1, padx=10, pady=10)
+    existing_db_button = Button(root, text="Выбрать", command=select_existing_db, state='disabled')
+    existing_db_button.grid(row=3, column=2, padx=10, pady=10)
 
-existing_db_button = Button(root, text="Выбрать", command=select_existing_db, state='disabled')
-existing_db_button.grid(row=3, column=2, padx=10, pady=10)
+    compare_button = Button(root, text="Сравнить", command=compare_databases, state='disabled')
+    compare_button.grid(row=4, column=1, padx=10, pady=10)
 
-compare_button = Button(root, text="Сравнить", command=compare_databases, state='disabled')
-compare_button.grid(row=4, column=1, padx=10, pady=10)
+    similarity_threshold_label = Label(root, text="% схожести:")
+    similarity_threshold_label.grid(row=5, column=0, padx=10, pady=10)
 
-similarity_threshold_label = Label(root, text="% схожести:")
-similarity_threshold_label.grid(row=5, column=0, padx=10, pady=10)
+    similarity_threshold = IntVar(value=80)
+    similarity_threshold_entry = Entry(root, textvariable=similarity_threshold, width=5)
+    similarity_threshold_entry.grid(row=5, column=1, padx=10, pady=10, sticky="w")
 
-similarity_threshold = IntVar(value=80)
-similarity_threshold_entry = Entry(root, textvariable=similarity_threshold, width=5)
-similarity_threshold_entry.grid(row=5, column=1, padx=10, pady=10, sticky="w")
+    apply_button = Button(root, text="Применить %", command=update_highlighting)
+    apply_button.grid(row=5, column=2, padx=10, pady=10)
 
-apply_button = Button(root, text="Применить %", command=update_highlighting)
-apply_button.grid(row=5, column=2, padx=10, pady=10)
+    monitor_rvt_ifc = IntVar(value=1)
+    monitor_dwg_ifc = IntVar(value=0)
 
-monitor_rvt_ifc = IntVar(value=1)
-monitor_dwg_ifc = IntVar(value=0)
+    rvt_ifc_checkbox = Checkbutton(root, text=".rvt и .ifc", variable=monitor_rvt_ifc)
+    rvt_ifc_checkbox.grid(row=6, column=0, padx=10, pady=10)
 
-rvt_ifc_checkbox = Checkbutton(root, text=".rvt и .ifc", variable=monitor_rvt_ifc)
-rvt_ifc_checkbox.grid(row=6, column=0, padx=10, pady=10)
+    dwg_ifc_checkbox = Checkbutton(root, text=".dwg и .ifc", variable=monitor_dwg_ifc)
+    dwg_ifc_checkbox.grid(row=6, column=1, padx=10, pady=10)
 
-dwg_ifc_checkbox = Checkbutton(root, text=".dwg и .ifc", variable=monitor_dwg_ifc)
-dwg_ifc_checkbox.grid(row=6, column=1, padx=10, pady=10)
+    incremental_scan = IntVar(value=0)
+    incremental_checkbox = Checkbutton(root, text="Дополнить последнюю БД", variable=incremental_scan)
+    incremental_checkbox.grid(row=6, column=2, padx=10, pady=10)
 
-start_button = Button(root, text="Начать мониторинг", command=start_monitoring)
-start_button.grid(row=7, column=0, columnspan=3, padx=10, pady=20)
+    start_button = Button(root, text="Начать мониторинг", command=start_monitoring)
+    start_button.grid(row=7, column=0, columnspan=2, padx=10, pady=20)
 
-columns = ("Имя файла", "Родительская Папка", "Путь", "Последнее Изменение", "Создано")
-tree = ttk.Treeview(root, columns=columns, show="headings")
-tree.heading("Имя файла", text="Имя файла")
-tree.heading("Родительская Папка", text="Папка")
-tree.heading("Путь", text="Путь")
-tree.heading("Последнее Изменение", text="Последнее изм.")
-tree.heading("Создано", text="Кем создано")
-tree.grid(row=8, column=0, columnspan=3, padx=10, pady=20, sticky="nsew")
+    cancel_button = Button(root, text="Отмена", command=cancel_task, state='disabled')
+    cancel_button.grid(row=7, column=2, padx=10, pady=20)
 
-root.grid_rowconfigure(8, weight=1)
-root.grid_columnconfigure(1, weight=1)
+    filter_frame = Frame(root)
+    filter_frame.grid(row=8, column=0, columnspan=3, padx=10, sticky="w")
 
-tree.tag_configure("highlight", background="lightgreen")
-tree.tag_configure("rvt", background="lightblue")
-tree.tag_configure("dwg", background="lavender")
-tree.tag_configure("ifc", background="lightyellow")
-tree.tag_configure("changed", background="orange")
-tree.tag_configure("new", background="lightgreen")
-tree.tag_configure("missing", background="red")
+    Label(filter_frame, text="Папка:").pack(side="left")
+    folder_filter = ttk.Combobox(filter_frame, values=[""], state="readonly", width=30)
+    folder_filter.pack(side="left", padx=5)
+    folder_filter.bind("<<ComboboxSelected>>", apply_filters)
 
-pdf_button = Button(root, text="Отчет PDF", command=create_pdf_report)
-pdf_button.grid(row=9, column=0, padx=10, pady=10)
+    Label(filter_frame, text="Тип:").pack(side="left")
+    extension_filter = ttk.Combobox(filter_frame, values=EXTENSION_FILTERS, state="readonly", width=6)
+    extension_filter.pack(side="left", padx=5)
+    extension_filter.bind("<<ComboboxSelected>>", apply_filters)
 
-excel_button = Button(root, text="Отчет Excel", command=export_to_excel)
-excel_button.grid(row=9, column=1, padx=10, pady=10)
+    Label(filter_frame, text="Подсветка:").pack(side="left")
+    highlight_filter = StringVar(value="Все")
+    highlight_filter_box = ttk.Combobox(filter_frame, textvariable=highlight_filter, values=list(HIGHLIGHT_FILTERS),
+                                        state="readonly", width=15)
+    highlight_filter_box.pack(side="left", padx=5)
+    highlight_filter_box.bind("<<ComboboxSelected>>", apply_filters)
 
-copy_button = Button(root, text="Скопировать путь", command=copy_path)
-copy_button.grid(row=9, column=2, padx=10, pady=10)
+    # Колонка таблицы -> ключ сортировки в базе
+    columns = ("Имя файла", "Родительская Папка", "Путь", "Последнее Изменение", "Создано")
+    sort_keys = ("filename", "parent_folder", "path", "last_modified", "created_by")
+    tree = ttk.Treeview(root, columns=columns, show="headings")
+    tree.heading("Имя файла", text="Имя файла")
+    tree.heading("Родительская Папка", text="Папка")
+    tree.heading("Путь", text="Путь")
+    tree.heading("Последнее Изменение", text="Последнее изм.")
+    tree.heading("Создано", text="Кем создано")
+    for column, sort_key in zip(columns, sort_keys):
+        tree.heading(column, command=lambda key=sort_key: sort_by(key))
+    tree.grid(row=9, column=0, columnspan=3, padx=(10, 0), pady=20, sticky="nsew")
 
-root.mainloop()
+    tree_scrollbar = ttk.Scrollbar(root, orient="vertical")
+    tree_scrollbar.grid(row=9, column=3, padx=(0, 10), pady=20, sticky="ns")
+    results_view = ResultsView(tree, tree_scrollbar)
 
-if conn:
-    conn.close()
\ No newline at end of file
+    root.grid_rowconfigure(9, weight=1)
+    root.grid_columnconfigure(1, weight=1)
+
+    tree.tag_configure("highlight", background="lightgreen")
+    tree.tag_configure("rvt", background="lightblue")
+    tree.tag_configure("dwg", background="lavender")
+    tree.tag_configure("ifc", background="lightyellow")
+    tree.tag_configure("changed", background="orange")
+    tree.tag_configure("new", background="lightgreen")
+    tree.tag_configure("missing", background="red")
+
+    pdf_button = Button(root, text="Отчет PDF", command=create_pdf_report)
+    pdf_button.grid(row=10, column=0, padx=10, pady=10)
+
+    excel_button = Button(root, text="Отчет Excel", command=export_to_excel)
+    excel_button.grid(row=10, column=1, padx=10, pady=10)
+
+    copy_button = Button(root, text="Скопировать путь", command=copy_path)
+    copy_button.grid(row=10, column=2, padx=10, pady=10)
+
+    status_label = Label(root, text="", anchor="w")
+    status_label.grid(row=11, column=0, columnspan=3, padx=10, pady=5, sticky="we")
+
+    metrics_label = Label(root, text="", anchor="w", fg="gray")
+    metrics_label.grid(row=12, column=0, columnspan=2, padx=10, pady=5, sticky="we")
+
+    metrics_button = Button(root, text="Сохранить метрики", command=export_metrics)
+    metrics_button.grid(row=12, column=2, padx=10, pady=5)
+
+    root.protocol("WM_DELETE_WINDOW", close_app)
+    root.after(METRICS_POLL_MS, poll_metrics)
+    # SEARCH_IFCS_PROFILE=файл - профиль cProfile всей работы окна для поиска медленных мест;
+    # close_app дожидается фоновой операции и монитора, поэтому их профили тоже попадают в файл
+    with profiled(os.environ.get(PROFILE_ENV_VAR)):
+        root.mainloop()
+
+    if conn:
+        conn.close()
\ No newline at end of file
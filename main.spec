@@ -5,7 +5,7 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[],
+    datas=[('fonts/DejaVuSans.ttf', 'fonts'), ('fonts/LICENSE.txt', 'fonts')],
     hiddenimports=['openpyxl.cell._writer'],
     hookspath=[],
     hooksconfig={},
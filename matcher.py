@@ -0,0 +1,136 @@
+import os
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from database import load_dirty_groups, load_group, save_group_matches, reset_matches, get_setting, set_setting
+from metrics import metrics
+
+# Исходные модели и их выгрузки: сравниваются только пары rvt×ifc и dwg×ifc
+SOURCE_EXTENSIONS = ('.rvt', '.dwg')
+EXPORT_EXTENSION = '.ifc'
+
+# Ширина корзины по длине имени: источники из одной корзины сравниваются
+# одним вызовом cdist со всеми выгрузками подходящей длины
+LENGTH_BUCKET = 4
+
+# Меньшие матрицы считаются в одном потоке: запуск потоков дороже самого сравнения
+PARALLEL_MIN_PAIRS = 10000
+
+# Оценки ниже этого порога не сохраняются; порог % ниже него пересчитывает все заново
+MATCH_SCORE_FLOOR = 50
+
+
+def _length_bounds(low, high, threshold):
+    # fuzz.ratio = 100 * (1 - dist / (len1 + len2)), а dist >= |len1 - len2|,
+    # поэтому при ratio >= threshold длина второго имени ограничена - отсев без потерь
+    k = (100 - threshold) / 100
+    if k >= 1:
+        return 0, float('inf')
+    return low * (1 - k) / (1 + k), high * (1 + k) / (1 - k)
+
+
+def split_group(files):
+    # files: [(key, filename)] -> (источники, выгрузки) как [(key, имя без расширения)]
+    sources = []
+    exports = []
+    for key, filename in files:
+        base, ext = os.path.splitext(filename)
+        if ext == EXPORT_EXTENSION:
+            exports.append((key, base))
+        elif ext in SOURCE_EXTENSIONS:
+            sources.append((key, base))
+    return sources, exports
+
+
+def score_pairs(sources, exports, threshold, workers=1):
+    # sources, exports: [(key, имя без расширения)].
+    # Возвращает [(key источника, key выгрузки, score)] для пар со score >= threshold
+    if not sources or not exports:
+        return []
+    exports = sorted(exports, key=lambda item: len(item[1]))
+    export_lengths = [len(name) for _, name in exports]
+    buckets = {}
+    for source in sources:
+        buckets.setdefault(len(source[1]) // LENGTH_BUCKET, []).append(source)
+    matches = []
+    for bucket, bucket_sources in buckets.items():
+        low, high = _length_bounds(bucket * LENGTH_BUCKET, bucket * LENGTH_BUCKET + LENGTH_BUCKET - 1, threshold)
+        start = bisect_left(export_lengths, low)
+        end = bisect_right(export_lengths, high)
+        if start >= end:
+            continue
+        candidates = exports[start:end]
+        metrics.count("match_comparisons", len(bucket_sources) * len(candidates))
+        bucket_workers = workers if len(bucket_sources) * len(candidates) >= PARALLEL_MIN_PAIRS else 1
+        scores = process.cdist([name for _, name in bucket_sources], [name for _, name in candidates],
+                               scorer=fuzz.ratio, score_cutoff=threshold, dtype=np.float64,
+                               workers=bucket_workers)
+        for i, j in np.argwhere(scores >= threshold):
+            matches.append((bucket_sources[i][0], candidates[j][0], float(scores[i, j])))
+    return matches
+
+
+def match_group(files, threshold, workers=1):
+    # files: [(key, filename)] одной группы (папка + день изменения)
+    sources, exports = split_group(files)
+    return score_pairs(sources, exports, threshold, workers)
+
+
+def _score_group(members, floor, workers):
+    # members: [(id, filename, match_dirty)] одной группы -> (id устаревших файлов, новые оценки):
+    # пары устаревших файлов со всей группой, без пар между уже посчитанными файлами
+    dirty = {file_id for file_id, _, match_dirty in members if match_dirty}
+    sources, exports = split_group((file_id, filename) for file_id, filename, _ in members)
+    dirty_sources = [item for item in sources if item[0] in dirty]
+    clean_sources = [item for item in sources if item[0] not in dirty]
+    dirty_exports = [item for item in exports if item[0] in dirty]
+    rows = score_pairs(dirty_sources, exports, floor, workers)
+    rows += score_pairs(clean_sources, dirty_exports, floor, workers)
+    return dirty, rows
+
+
+def _score_groups(groups, floor):
+    # В процессе пула: все группы одного корня. Счетчики процесса пула до вызывающего не доходят,
+    # поэтому число сравнений возвращается вместе с оценками
+    before = metrics.snapshot()["counters"].get("match_comparisons", 0)
+    results = [_score_group(members, floor, 1) for members in groups]
+    return results, metrics.snapshot()["counters"].get("match_comparisons", 0) - before
+
+
+def refresh_matches(conn, threshold, workers=-1, processes=None):
+    # Пересчитывает сохраненные оценки только для файлов с match_dirty = 1.
+    # processes > 1 - корни считаются параллельно в процессах, в базу пишет только вызывающий.
+    # Возвращает число пересчитанных групп
+    started = time.perf_counter()
+    stored_floor = get_setting(conn, "match_score_floor")
+    floor = float(stored_floor) if stored_floor is not None else MATCH_SCORE_FLOOR
+    if threshold < floor:
+        reset_matches(conn)
+        floor = threshold
+    if stored_floor is None or float(stored_floor) != floor:
+        set_setting(conn, "match_score_floor", str(floor))
+    groups = load_dirty_groups(conn)
+    roots = {root for root, _, _ in groups}
+    if processes and processes > 1 and len(roots) > 1:
+        with ProcessPoolExecutor(max_workers=min(processes, len(roots))) as pool:
+            futures = [pool.submit(_score_groups, [load_group(conn, *group) for group in groups if group[0] == root],
+                                   floor)
+                       for root in roots]
+            for future in as_completed(futures):
+                results, comparisons = future.result()
+                metrics.count("match_comparisons", comparisons)
+                with metrics.timed("db_write"):
+                    for dirty, rows in results:
+                        save_group_matches(conn, dirty, rows)
+    else:
+        for group in groups:
+            dirty, rows = _score_group(load_group(conn, *group), floor, workers)
+            with metrics.timed("db_write"):
+                save_group_matches(conn, dirty, rows)
+    metrics.count("match_groups", len(groups))
+    metrics.observe("match", time.perf_counter() - started)
+    return len(groups)
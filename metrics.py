@@ -0,0 +1,160 @@
+import cProfile
+import json
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# Счетчики и замеры времени этапов: обход папок, запись в базу, сравнение имен, таблица, отчеты.
+# Один набор на процесс; пишут и главный поток, и поток монитора, поэтому под блокировкой.
+# Имена - в формате Prometheus (буквы, цифры, _)
+PROMETHEUS_PREFIX = "search_ifcs_"
+
+# Переменная окружения: включить cProfile для GUI и записать статистику в этот файл
+PROFILE_ENV_VAR = "SEARCH_IFCS_PROFILE"
+
+# cProfile видит только поток, в котором включен: пока работает profiled(), фоновые потоки
+# профилируются отдельно (thread_profiled) и складывают профили сюда
+_profiles_lock = threading.Lock()
+_thread_profiles = None
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.monotonic()
+            self.counters = {}
+            self.gauges = {}
+            # имя -> [число замеров, сумма секунд, максимум секунд]
+            self.timings = {}
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timing = self.timings.get(name)
+            if timing is None:
+                self.timings[name] = [1, seconds, seconds]
+            else:
+                timing[0] += 1
+                timing[1] += seconds
+                timing[2] = max(timing[2], seconds)
+
+    @contextmanager
+    def timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "uptime_seconds": time.monotonic() - self.started,
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "timings": {name: {"count": count, "total_seconds": total, "max_seconds": longest}
+                            for name, (count, total, longest) in self.timings.items()},
+            }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self):
+        snapshot = self.snapshot()
+        lines = [f"# TYPE {PROMETHEUS_PREFIX}uptime_seconds gauge",
+                 f"{PROMETHEUS_PREFIX}uptime_seconds {snapshot['uptime_seconds']:.3f}"]
+        for name, value in sorted(snapshot["counters"].items()):
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}{name}_total counter", f"{PROMETHEUS_PREFIX}{name}_total {value}"]
+        for name, value in sorted(snapshot["gauges"].items()):
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}{name} gauge", f"{PROMETHEUS_PREFIX}{name} {value}"]
+        for name, timing in sorted(snapshot["timings"].items()):
+            metric = f"{PROMETHEUS_PREFIX}{name}_seconds"
+            lines += [f"# TYPE {metric} summary",
+                      f"{metric}_count {timing['count']}",
+                      f"{metric}_sum {timing['total_seconds']:.6f}",
+                      f"# TYPE {metric}_max gauge",
+                      f"{metric}_max {timing['max_seconds']:.6f}"]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def write_metrics(path):
+    # .json - JSON, иначе текстовый формат Prometheus (для node_exporter textfile и т.п.)
+    text = metrics.to_json() if path.lower().endswith(".json") else metrics.to_prometheus()
+    with open(path, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(text)
+
+
+def rate(current, previous, counter, elapsed):
+    # Скорость счетчика между двумя снимками snapshot(), в единицах в секунду
+    if elapsed <= 0:
+        return 0.0
+    return (current["counters"].get(counter, 0) - previous["counters"].get(counter, 0)) / elapsed
+
+
+def mean_seconds(current, previous, timing):
+    # Среднее время замера между двумя снимками или None, если замеров не было
+    now = current["timings"].get(timing)
+    if now is None:
+        return None
+    before = previous["timings"].get(timing, {"count": 0, "total_seconds": 0.0})
+    count = now["count"] - before["count"]
+    if not count:
+        return None
+    return (now["total_seconds"] - before["total_seconds"]) / count
+
+
+@contextmanager
+def profiled(path):
+    # Необязательный cProfile: без пути ничего не делает, иначе пишет статистику для pstats/snakeviz.
+    # В файл попадают и профили фоновых потоков, закончившихся до выхода из блока
+    global _thread_profiles
+    if not path:
+        yield
+        return
+    with _profiles_lock:
+        _thread_profiles = []
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _profiles_lock:
+            profiles, _thread_profiles = _thread_profiles, None
+        stats = pstats.Stats(profiler)
+        for thread_profile in profiles:
+            stats.add(thread_profile)
+        stats.dump_stats(path)
+
+
+@contextmanager
+def thread_profiled():
+    # Тело фонового потока (BackgroundTask, монитор): под profiled() профилирует этот поток,
+    # иначе ничего не делает
+    if _thread_profiles is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _profiles_lock:
+            if _thread_profiles is not None:
+                _thread_profiles.append(profiler)
@@ -0,0 +1,224 @@
+import os
+import getpass
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from watchdog.events import PatternMatchingEventHandler
+
+from database import open_database, apply_file_changes
+from metrics import metrics, thread_profiled
+from scanner import WORK_FOLDER_NAME, IGNORED_FILE_PATTERNS, is_wanted_file
+
+UPSERT = "upsert"
+DELETE = "delete"
+MOVE = "move"
+
+# События по одному пути за это время сливаются в одно
+DEBOUNCE_SECONDS = 0.5
+# При непрерывном потоке событий пачка все равно записывается не реже, чем раз в столько секунд
+MAX_DELAY_SECONDS = 5.0
+# Столько секунд запись пачки ждет, пока базу держит другой писатель (сканирование, отчет, cli.py scan)
+DB_TIMEOUT_SECONDS = 30.0
+# Незаписанная пачка повторяется с новыми событиями или, если их нет, через столько секунд
+RETRY_SECONDS = 5.0
+
+# Результат записи одной пачки: пути, перемещения (старый путь, новый путь), число событий,
+# время постановки самого раннего события каждого пути в очередь (time.monotonic)
+# и время фиксации транзакции. Новые пути перемещений входят и в upserted.
+# error - исключение записи (пачка будет повторена, списки пустые) или пересчета оценок после нее
+MonitorBatch = namedtuple("MonitorBatch", "upserted deleted moved events queued_at applied_at error",
+                          defaults=(None,))
+
+
+def watch_patterns(file_extensions):
+    # Шаблоны сопоставляются с концом пути: файл нужного типа прямо в папке "Работа"
+    return [f"{WORK_FOLDER_NAME}/*{ext}" for ext in file_extensions]
+
+
+class QueueingEventHandler(PatternMatchingEventHandler):
+    # Работает в потоке watchdog: отсеивает лишние файлы по шаблонам
+    # и только кладет события в очередь
+    def __init__(self, events, file_extensions):
+        super().__init__(patterns=watch_patterns(file_extensions), ignore_patterns=list(IGNORED_FILE_PATTERNS),
+                         ignore_directories=True)
+        self.events = events
+
+    def on_created(self, event):
+        self.events.put((UPSERT, event.src_path, time.monotonic()))
+
+    def on_modified(self, event):
+        self.events.put((UPSERT, event.src_path, time.monotonic()))
+
+    def on_deleted(self, event):
+        self.events.put((DELETE, event.src_path, time.monotonic()))
+
+    def on_moved(self, event):
+        # Приходит, если под шаблоны попадает старый или новый путь
+        self.events.put((MOVE, (event.src_path, event.dest_path), time.monotonic()))
+
+
+class EventPipeline:
+    # Потребитель очереди событий: в своем потоке и со своим подключением к базе
+    # сливает события по пути, пишет пачку одной транзакцией и кладет MonitorBatch
+    # в batches - GUI забирает их в главном потоке через root.after.
+    # root - корневая папка наблюдения, с которой записываются файлы. after_write(conn) вызывается
+    # в том же потоке после записи пачки и до того, как она попадет в batches (например, пересчет оценок)
+    def __init__(self, db_path, file_extensions, debounce=DEBOUNCE_SECONDS, max_delay=MAX_DELAY_SECONDS, root=None,
+                 after_write=None, db_timeout=DB_TIMEOUT_SECONDS, retry_delay=RETRY_SECONDS):
+        self.db_path = db_path
+        self.db_timeout = db_timeout
+        self.retry_delay = retry_delay
+        self.root = root
+        self.after_write = after_write
+        self.file_extensions = tuple(file_extensions)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.created_by = getpass.getuser()
+        self.events = queue.Queue()
+        self.batches = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.events.put(None)
+        self._thread.join()
+
+    def is_relevant(self, path):
+        return (is_wanted_file(os.path.basename(path), self.file_extensions)
+                and os.path.basename(os.path.dirname(path)) == WORK_FOLDER_NAME)
+
+    def _merge(self, pending, kind, path, queued_at):
+        # pending: путь -> (kind, время первого события, старый путь для MOVE)
+        if kind == MOVE:
+            src, path = path
+            previous = pending.pop(src, None)
+            origin = previous[2] if previous is not None and previous[0] == MOVE else None
+            first_queued_at = previous[1] if previous else queued_at
+            if not self.is_relevant(path):
+                # Модель переименована во что-то постороннее ("безопасное сохранение": a.dwg -> a.bak,
+                # a.rvt -> a.0001.rvt) - это удаление под ключом старого пути, чтобы следующее событие
+                # по нему (временный файл -> a.dwg) его заменило. Начало цепочки тоже удаляется,
+                # если по нему не пришло ничего новее
+                pending[src] = (DELETE, first_queued_at, None)
+                if origin is not None:
+                    pending.setdefault(origin, (DELETE, first_queued_at, None))
+                return
+            # Цепочка переименований a -> b -> c: в базе есть только a
+            pending[path] = (MOVE, first_queued_at, origin if origin is not None else src)
+            return
+        previous = pending.get(path)
+        if previous is None:
+            pending[path] = (kind, queued_at, None)
+        elif previous[0] == MOVE:
+            # Изменение после переименования: перемещение все равно перечитает файл,
+            # удаление убирает и старую, и новую запись
+            if kind == DELETE:
+                pending[previous[2]] = (DELETE, previous[1], None)
+                pending[path] = (DELETE, previous[1], None)
+        else:
+            pending[path] = (kind, previous[1], None)
+
+    def _collect(self, pending=None, events=0):
+        # Ждет первое событие, затем копит, пока события идут чаще debounce
+        # и пока с первого события не прошло max_delay. Возвращает (pending, events, stopped).
+        # pending и events - незаписанная прошлая пачка: новые события сливаются с ней,
+        # а если их нет, она возвращается на повтор через retry_delay
+        pending = pending or {}
+        try:
+            item = self.events.get(timeout=self.retry_delay if pending else None)
+        except queue.Empty:
+            return pending, events, False
+        if item is None:
+            return pending, events, True
+        started = time.monotonic()
+        while True:
+            self._merge(pending, *item)
+            events += 1
+            timeout = min(self.debounce, self.max_delay - (time.monotonic() - started))
+            if timeout <= 0:
+                return pending, events, False
+            try:
+                item = self.events.get(timeout=timeout)
+            except queue.Empty:
+                return pending, events, False
+            if item is None:
+                return pending, events, True
+
+    def _file_row(self, path):
+        try:
+            file_stat = os.stat(path)
+        except OSError:
+            return None
+        parent_folder = os.path.basename(os.path.dirname(os.path.dirname(path)))
+        return (parent_folder, path, os.path.basename(path), file_stat.st_mtime, self.created_by,
+                file_stat.st_size)
+
+    def _apply(self, conn, pending, events):
+        upserts = []
+        deletes = []
+        moves = []
+        queued_at = []
+        for path, (kind, first_queued_at, src) in pending.items():
+            if kind == MOVE:
+                if not self.is_relevant(src):
+                    # Временный файл переименован в модель - как создание.
+                    # Перемещение в постороннее имя сюда не доходит: _merge хранит его как удаление
+                    kind = UPSERT
+            if not self.is_relevant(path):
+                continue
+            queued_at.append(first_queued_at)
+            row = self._file_row(path) if kind != DELETE else None
+            if row is None:
+                deletes.append(src if kind == MOVE else path)
+                if kind == MOVE:
+                    deletes.append(path)
+            elif kind == MOVE:
+                moves.append((src, row))
+            else:
+                upserts.append(row)
+        if upserts or deletes or moves:
+            metrics.count("db_rows", len(upserts) + len(deletes) + len(moves))
+            with metrics.timed("db_write"):
+                apply_file_changes(conn, upserts, deletes, moves, self.root)
+        applied_at = time.monotonic()
+        error = None
+        if self.after_write is not None and (upserts or deletes or moves):
+            try:
+                self.after_write(conn)
+            except Exception as e:
+                # Пачка уже записана и не повторяется: устаревшие оценки пересчитает следующая
+                metrics.count("monitor_errors")
+                error = e
+        metrics.count("monitor_events", events)
+        # Глубина очереди - события, пришедшие, пока писалась эта пачка
+        metrics.set("monitor_queue_depth", self.events.qsize())
+        if queued_at:
+            metrics.observe("monitor_batch_latency", applied_at - min(queued_at))
+        self.batches.put(MonitorBatch([row[1] for row in upserts] + [row[1] for _, row in moves], deletes,
+                                      [(src, row[1]) for src, row in moves], events, queued_at, applied_at,
+                                      error))
+
+    def _run(self):
+        # Ошибка записи не останавливает поток: пачка остается в pending до успешной записи,
+        # GUI узнает об ошибке из batches
+        with thread_profiled():
+            conn = open_database(self.db_path, timeout=self.db_timeout)
+            try:
+                pending, events, stopped = {}, 0, False
+                while not stopped:
+                    pending, events, stopped = self._collect(pending, events)
+                    if not pending:
+                        continue
+                    try:
+                        self._apply(conn, pending, events)
+                    except Exception as e:
+                        metrics.count("monitor_errors")
+                        self.batches.put(MonitorBatch([], [], [], events, [], time.monotonic(), e))
+                        continue
+                    pending, events = {}, 0
+            finally:
+                conn.close()
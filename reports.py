@@ -0,0 +1,199 @@
+import csv
+import os
+import time
+from datetime import datetime
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
+
+from reportlab.lib import colors
+from reportlab.pdfgen import canvas
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.pagesizes import letter, landscape
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from database import format_mtime, iter_highlighted_files, count_files, HIGHLIGHT_MATCHED
+from matcher import refresh_matches
+from metrics import metrics
+
+# Шрифт отчета PDF: путь из переменной окружения, иначе шрифт рядом с программой (папка fonts,
+# входит в сборку main.spec), иначе системные шрифты с кириллицей
+FONT_ENV_VAR = "SEARCH_IFCS_FONT"
+FONT_CANDIDATES = (
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts", "DejaVuSans.ttf"),
+    r"C:\Windows\Fonts\arial.ttf",
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+)
+# Шрифт без этой буквы печатает имена и пути квадратиками
+CYRILLIC_PROBE = "Ж"
+
+EXCEL_HEADERS = ["Имя файла", "Родительская Папка", "Путь", "Последнее Изменение", "Создано"]
+
+_registered_fonts = {}
+
+
+def count_report_rows(conn, threshold):
+    # Пересчитывает устаревшие оценки и возвращает число подсвеченных файлов
+    refresh_matches(conn, threshold)
+    return count_files(conn, threshold, highlight=HIGHLIGHT_MATCHED)
+
+
+def iter_report_rows(conn, threshold):
+    # Подсвеченные файлы по папкам: (filename, parent_folder, path, последнее изменение строкой, created_by).
+    # Строки читаются из курсора по одной; оценки должны быть уже пересчитаны (count_report_rows)
+    for filename, parent_folder, path, last_modified, created_by in iter_highlighted_files(conn, threshold):
+        yield filename, parent_folder, path, format_mtime(last_modified), created_by
+
+
+def report_file_name(root_folder_name, now):
+    return f"{root_folder_name}_{now.strftime('%Y-%m-%d_%H-%M-%S')}.pdf"
+
+
+def resolve_font_path(font_path=None):
+    if font_path:
+        return font_path
+    for candidate in (os.environ.get(FONT_ENV_VAR),) + FONT_CANDIDATES:
+        if candidate and os.path.isfile(candidate):
+            return candidate
+    raise ValueError(f"Не найден шрифт для отчета PDF: укажите файл TTF с кириллицей в {FONT_ENV_VAR}")
+
+
+def register_font(font_path):
+    # TTF разбирается один раз на процесс; возвращает имя шрифта для canvas.
+    # ValueError - в шрифте нет кириллицы
+    name = _registered_fonts.get(font_path)
+    if name is None:
+        name = f"ReportFont{len(_registered_fonts)}"
+        font = TTFont(name, font_path)
+        if ord(CYRILLIC_PROBE) not in font.face.charToGlyph:
+            raise ValueError(f"В шрифте {font_path} нет кириллицы, укажите другой файл TTF")
+        pdfmetrics.registerFont(font)
+        _registered_fonts[font_path] = name
+    return name
+
+
+@lru_cache(maxsize=4096)
+def text_width(text, font, font_size):
+    # Слова путей и имена папок повторяются из строки в строку
+    return pdfmetrics.stringWidth(text, font, font_size)
+
+
+def wrap_text(text, max_width, font, font_size):
+    # Ширина строки TTF - сумма ширин символов (без кернинга), поэтому каждое слово
+    # измеряется один раз, а ширина собираемой строки накапливается
+    words = text.split(' ')
+    space_width = text_width(' ', font, font_size)
+    lines = []
+    current_line = words[0]
+    current_width = text_width(current_line, font, font_size)
+    for word in words[1:]:
+        word_width = text_width(word, font, font_size)
+        if current_width + space_width + word_width < max_width:
+            current_line += ' ' + word
+            current_width += space_width + word_width
+        else:
+            lines.append(current_line)
+            current_line = word
+            current_width = word_width
+    lines.append(current_line)
+    return lines
+
+
+def write_pdf_report(pdf_path, root_folder_name, highlighted_files, font_path=None):
+    # highlighted_files - строки как у iter_report_rows, сгруппированные по папкам; читаются по одной,
+    # готовые страницы сразу сжимаются. Возвращает число строк
+    started = time.perf_counter()
+    font = register_font(resolve_font_path(font_path))
+    c = canvas.Canvas(pdf_path, pagesize=landscape(letter), pageCompression=1)
+    width, height = landscape(letter)
+    path_max_width = width - 440
+    c.setFont(font, 14)
+    c.drawString(30, height - 30, f"Отчет по файлам в '{root_folder_name}'")
+    c.setFont(font, 10)
+    c.drawString(30, height - 50, f"Сгенерировано: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    y_position = height - 70
+
+    def draw_column_headers(y):
+        c.setFont(font, 10)
+        c.drawString(30, y, "Имя файла")
+        c.drawString(200, y, "Последнее изм.")
+        c.drawString(300, y, "Путь")
+        return y - 20
+
+    count = 0
+    for parent_folder, files in groupby(highlighted_files, key=itemgetter(1)):
+        # Заголовок папки не остается внизу страницы без строк
+        if y_position < 80:
+            c.showPage()
+            y_position = height - 30
+        c.setFont(font, 12)
+        c.drawString(30, y_position, f"Папка: {parent_folder}")
+        y_position = draw_column_headers(y_position - 20)
+        for filename, _, path, last_modified, created_by in files:
+            count += 1
+            c.drawString(30, y_position, filename)
+            c.drawString(200, y_position, last_modified)
+            path_lines = wrap_text(path, path_max_width, font, 10)
+            for line in path_lines:
+                c.drawString(300, y_position, line)
+                y_position -= 12
+            if len(path_lines) == 1 and text_width(path_lines[0], font, 10) <= path_max_width:
+                c.setFillColor(colors.blue)
+                c.linkURL(f"file://{path}", (300, y_position + 12, width - 30, y_position + 24), relative=0)
+                c.setFillColor(colors.black)
+            y_position -= 8
+            if y_position < 40:
+                c.showPage()
+                y_position = draw_column_headers(height - 30)
+    c.save()
+    metrics.observe("report_pdf", time.perf_counter() - started)
+    metrics.count("report_rows", count)
+    return count
+
+
+def write_excel_report(save_path, highlighted_files):
+    # Книга в режиме write-only: строки сразу уходят во временный XML листа и в памяти не копятся.
+    # Возвращает число строк
+    started = time.perf_counter()
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Отчет по файлам")
+    header_font = Font(bold=True)
+    headers = []
+    for header in EXCEL_HEADERS:
+        cell = WriteOnlyCell(sheet, value=header)
+        cell.font = header_font
+        headers.append(cell)
+    sheet.append(headers)
+    count = 0
+    try:
+        for file in highlighted_files:
+            sheet.append(file)
+            count += 1
+    except BaseException:
+        # Прерванная выгрузка: временный файл листа закрывается сразу, а не при сборке мусора
+        sheet.close()
+        raise
+    workbook.save(save_path)
+    metrics.observe("report_excel", time.perf_counter() - started)
+    metrics.count("report_rows", count)
+    return count
+
+
+def write_csv_report(save_path, highlighted_files):
+    # Быстрый вариант для других программ: те же столбцы, UTF-8 с BOM, чтобы Excel узнал кодировку
+    started = time.perf_counter()
+    with open(save_path, "w", newline="", encoding="utf-8-sig") as report_file:
+        writer = csv.writer(report_file)
+        writer.writerow(EXCEL_HEADERS)
+        count = 0
+        for file in highlighted_files:
+            writer.writerow(file)
+            count += 1
+    metrics.observe("report_csv", time.perf_counter() - started)
+    metrics.count("report_rows", count)
+    return count
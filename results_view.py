@@ -0,0 +1,232 @@
+from database import count_files, load_files_page, load_compare_page, format_mtime, HIGHLIGHT_ANY
+from metrics import metrics
+
+# Высота строки и заголовков Treeview, пока ни одна строка еще не отрисована; потом - по bbox строки
+DEFAULT_ROW_HEIGHT = 20
+
+
+def file_type_tag(filename):
+    return 'rvt' if filename.endswith('.rvt') else 'ifc' if filename.endswith('.ifc') else 'dwg'
+
+
+class FilesSource:
+    # Строки таблицы files с фильтром и сортировкой на стороне SQLite
+    def __init__(self, conn, threshold, sort="parent_folder", descending=False, folder=None, extension=None,
+                 highlight=HIGHLIGHT_ANY):
+        self.conn = conn
+        self.threshold = threshold
+        self.sort = sort
+        self.descending = descending
+        self.filters = {"folder": folder, "extension": extension, "highlight": highlight}
+
+    def count(self):
+        return count_files(self.conn, self.threshold, **self.filters)
+
+    def page(self, limit, after=None, backward=False, skip=0, inclusive=False):
+        # Строки (iid, значения, теги, ключ); параметры - как у load_files_page
+        rows = load_files_page(self.conn, self.threshold, limit, self.sort, self.descending, after=after,
+                               backward=backward, skip=skip, inclusive=inclusive, **self.filters)
+        page = []
+        for file_id, filename, parent_folder, path, last_modified, created_by, highlighted, *key in rows:
+            tag = file_type_tag(filename)
+            page.append((str(file_id), (filename, parent_folder, path, format_mtime(last_modified), created_by),
+                         (tag, "highlight") if highlighted else (tag,), tuple(key)))
+        return page
+
+
+class CompareSource:
+    # Результат последнего сравнения из временной таблицы compare_results
+    def __init__(self, conn, counts, status=None):
+        self.conn = conn
+        self.status = status
+        self.total = counts[status] if status else sum(counts.values())
+
+    def count(self):
+        return self.total
+
+    def page(self, limit, after=None, backward=False, skip=0, inclusive=False):
+        return [(f"c{rowid}", (filename, parent_folder, path, format_mtime(last_modified), created_by), (status,),
+                 rowid)
+                for rowid, status, filename, parent_folder, path, last_modified, created_by
+                in load_compare_page(self.conn, limit, self.status, after, backward, skip, inclusive)]
+
+
+class ResultsView:
+    # Виртуальная таблица: в Treeview только видимое окно строк источника. Окно перечитывается от ключа
+    # своей первой или последней строки, поэтому прокрутка стоит столько строк, на сколько сдвинулось окно,
+    # а не сколько строк выше него. Строки источника считаются только в refresh() - при смене источника
+    # и когда данные изменились
+    def __init__(self, tree, scrollbar):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.source = None
+        # Номер первой строки окна - для полосы прокрутки; после изменения данных приблизительный
+        self.offset = 0
+        self.total = 0
+        # Строки окна (iid, значения, теги, ключ)
+        self._window = []
+        self._rows = {}
+        scrollbar.config(command=self.on_scroll)
+        tree.bind("<Configure>", lambda event: self.redraw())
+        # Обработчики возвращают "break": своя прокрутка Treeview сдвинула бы строки окна
+        tree.bind("<MouseWheel>", self.on_wheel)
+        tree.bind("<Button-4>", self.on_wheel)
+        tree.bind("<Button-5>", self.on_wheel)
+        tree.bind("<Prior>", lambda event: self.on_page(-1))
+        tree.bind("<Next>", lambda event: self.on_page(1))
+        tree.bind("<Up>", lambda event: self.on_arrow(-1))
+        tree.bind("<Down>", lambda event: self.on_arrow(1))
+
+    def visible_rows(self):
+        height = self.tree.winfo_height()
+        if height <= 1:
+            return int(self.tree.cget("height"))
+        # Первая строка окна: ее y - высота заголовков, ее высота - высота строки при текущих шрифте и стиле
+        box = self.tree.bbox(self._window[0][0]) if self._window else None
+        top, row_height = (box[1], box[3]) if box else (DEFAULT_ROW_HEIGHT, DEFAULT_ROW_HEIGHT)
+        return max(1, (height - top) // row_height)
+
+    def set_source(self, source):
+        self.source = source
+        self.offset = 0
+        self._window = []
+        self.refresh()
+
+    def refresh(self):
+        # Данные источника изменились: пересчитать строки и перечитать окно с той же первой строки
+        with metrics.timed("table_refresh"):
+            self.total = self.source.count() if self.source is not None else 0
+            self._reload()
+
+    def redraw(self):
+        # Изменилась высота таблицы: окно перечитывается без пересчета строк
+        with metrics.timed("table_scroll"):
+            self._reload()
+
+    def _reload(self):
+        if self.source is None:
+            self._show([])
+            return
+        visible = self.visible_rows()
+        rows = []
+        if self._window:
+            first_key = self._window[0][3]
+            rows = self.source.page(visible, after=first_key, inclusive=True)
+            if len(rows) < visible:
+                # Конец таблицы: окно добирается строками перед ним
+                before = self.source.page(visible - len(rows), after=first_key, backward=True)
+                self.offset -= len(before)
+                rows = before + rows
+        if not rows:
+            self.offset = 0
+            rows = self.source.page(visible)
+        self._show(rows)
+        if len(rows) == visible and self.visible_rows() != visible:
+            # Окно заполнялось по высоте строки по умолчанию, теперь она измерена
+            self._reload()
+
+    def _show(self, rows):
+        self._window = rows
+        self.offset = max(0, min(self.offset, self.total - len(rows)))
+        self._render(rows)
+        if self.total:
+            self.scrollbar.set(self.offset / self.total, min(1, (self.offset + len(rows)) / self.total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def _render(self, rows):
+        # Строки, ушедшие из окна, удаляются, новые вставляются, у оставшихся меняются
+        # только изменившиеся значения, теги и позиция
+        new_ids = {item for item, _, _, _ in rows}
+        removed = [item for item in self._rows if item not in new_ids]
+        if removed:
+            self.tree.delete(*removed)
+        for item in removed:
+            del self._rows[item]
+        for index, (item, values, tags, _) in enumerate(rows):
+            current = self._rows.get(item)
+            if current is None:
+                self.tree.insert('', index, iid=item, values=values, tags=tags)
+            else:
+                if current != (values, tags):
+                    self.tree.item(item, values=values, tags=tags)
+                if self.tree.index(item) != index:
+                    self.tree.move(item, '', index)
+            self._rows[item] = (values, tags)
+
+    def scroll_to(self, offset):
+        # Переход к строке offset из ближайшей известной точки: от окна по ключу его крайней строки,
+        # от начала или от конца таблицы. Пропускается только разница
+        if self.source is None:
+            return
+        visible = self.visible_rows()
+        offset = max(0, min(offset, self.total - visible))
+        from_end = max(0, self.total - visible - offset)
+        with metrics.timed("table_scroll"):
+            delta = offset - self.offset
+            if self._window and abs(delta) <= min(offset, from_end):
+                if delta:
+                    self._move_window(delta, visible)
+            elif offset <= from_end:
+                self.offset = offset
+                self._show(self.source.page(visible, skip=offset))
+            else:
+                rows = self.source.page(visible, backward=True, skip=from_end)
+                self.offset = self.total - from_end - len(rows)
+                self._show(rows)
+
+    def _move_window(self, delta, visible):
+        window = self._window
+        wanted = min(abs(delta), visible)
+        skip = max(0, abs(delta) - len(window))
+        if delta > 0:
+            rows = self.source.page(wanted, after=window[-1][3], skip=skip)
+            if len(rows) < wanted:
+                # Дальше строк нет: окно - конец таблицы
+                rows = self.source.page(visible, backward=True)
+                self.offset = self.total - len(rows)
+            else:
+                rows = (window + rows)[-visible:]
+                self.offset += skip + wanted + len(window) - len(rows)
+        else:
+            rows = self.source.page(wanted, after=window[0][3], backward=True, skip=skip)
+            if len(rows) < wanted:
+                rows = self.source.page(visible)
+                self.offset = 0
+            else:
+                rows = (rows + window)[:visible]
+                self.offset -= skip + wanted
+        self._show(rows)
+
+    def scroll_by(self, rows):
+        self.scroll_to(self.offset + rows)
+
+    def on_scroll(self, action, amount, unit=None):
+        visible = self.visible_rows()
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.total))
+        elif action == "scroll":
+            self.scroll_by(int(amount) * (visible if unit == "pages" else 1))
+
+    def on_wheel(self, event):
+        # Windows и macOS - event.delta, X11 - кнопки 4 (вверх) и 5 (вниз)
+        self.scroll_by(-3 if event.num == 4 or event.delta > 0 else 3)
+        return "break"
+
+    def on_page(self, direction):
+        self.scroll_by(direction * self.visible_rows())
+        return "break"
+
+    def on_arrow(self, step):
+        # Внутри окна выделение двигает привязка Treeview; на крайней строке окно сдвигается на строку,
+        # и выделение переходит на новую крайнюю строку
+        if not self._window:
+            return None
+        edge = 0 if step < 0 else -1
+        if self.tree.focus() != self._window[edge][0]:
+            return None
+        self.scroll_by(step)
+        item = self._window[edge][0]
+        self.tree.focus(item)
+        self.tree.selection_set(item)
+        return "break"
@@ -0,0 +1,324 @@
+import os
+import getpass
+import multiprocessing
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from fnmatch import fnmatch
+
+from database import (BATCH_SIZE, insert_files, update_files, delete_files, load_file_signatures,
+                      load_directories, load_directory_paths, save_directories, claim_root, get_setting,
+                      set_setting)
+from metrics import metrics
+
+WORK_FOLDER_NAME = "Работа"
+
+# Резервные копии Revit (имя.0001.rvt) и временные файлы не индексируются
+IGNORED_FILE_PATTERNS = ("*.[0-9][0-9][0-9][0-9].rvt", "~*")
+
+# На сетевых дисках каждый вызов scandir/stat - это сетевой запрос,
+# поэтому поддеревья обходятся параллельно
+DEFAULT_WORKERS = 8
+
+
+def get_file_extensions(rvt_ifc, dwg_ifc):
+    file_extensions = set()
+    if rvt_ifc:
+        file_extensions.update(('.rvt', '.ifc'))
+    if dwg_ifc:
+        file_extensions.update(('.dwg', '.ifc'))
+    return tuple(sorted(file_extensions))
+
+
+def _is_excluded(name, exclude_patterns):
+    return any(fnmatch(name, pattern) for pattern in exclude_patterns)
+
+
+def is_wanted_file(name, file_extensions):
+    return name.endswith(file_extensions) and not _is_excluded(name, IGNORED_FILE_PATTERNS)
+
+
+def _visit_directory(dirpath, depth, mtime, known, file_extensions, scandir):
+    # Возвращает (dirpath, depth, mtime, [(подпапка, mtime)], files).
+    # files для папок "Работа" - [(filename, path, mtime, size)], для остальных пустой.
+    # Конечная папка без подпапок, чей mtime не изменился, не листается вовсе (files = None):
+    # ее состав тот же, а файлы вне "Работа" не нужны. Остальные папки листаются всегда -
+    # mtime подпапок одним листингом дешевле, чем stat по каждой.
+    # Папка, которую не удалось пролистать целиком (сбой сети, нет доступа), возвращается
+    # с subdirs = None и files = None: ее состав неизвестен, а не пуст.
+    # stat берется из DirEntry: на Windows он уже получен вместе со списком
+    is_work_folder = os.path.basename(dirpath) == WORK_FOLDER_NAME
+    if known is not None and not is_work_folder and not known[1] and known[0] == mtime:
+        return dirpath, depth, mtime, [], None
+    subdirs = []
+    files = []
+    try:
+        with scandir(dirpath) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append((entry.path, entry.stat(follow_symlinks=False).st_mtime))
+                elif is_work_folder and is_wanted_file(entry.name, file_extensions):
+                    entry_stat = entry.stat()
+                    files.append((entry.name, entry.path, entry_stat.st_mtime, entry_stat.st_size))
+    except OSError:
+        metrics.count("scan_unlisted_dirs")
+        return dirpath, depth, mtime, None, None
+    return dirpath, depth, mtime, subdirs, files
+
+
+def crawl(root_folder, file_extensions, workers=DEFAULT_WORKERS, max_depth=None, exclude_patterns=(),
+          known_dirs=None, scandir=os.scandir, stat=os.stat):
+    # Выдает (dirpath, mtime, [(подпапка, mtime)], files) для каждой обойденной папки;
+    # у папки, которую не удалось пролистать, subdirs и files - None, ниже нее обход не идет.
+    # Недоступный корень - OSError: пустой обход удалил бы из базы все файлы корня.
+    # max_depth - глубина (от root_folder), глубже которой папки "Работа" не ищутся,
+    # exclude_patterns - маски имен папок, которые не обходятся вовсе,
+    # known_dirs - результат load_directories() прошлого обхода для инкрементального режима
+    file_extensions = tuple(file_extensions)
+    known_dirs = known_dirs or {}
+
+    def submit(dirpath, depth, mtime):
+        return pool.submit(_visit_directory, dirpath, depth, mtime, known_dirs.get(dirpath),
+                           file_extensions, scandir)
+
+    root_mtime = stat(root_folder).st_mtime
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            pending = {submit(root_folder, 0, root_mtime)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dirpath, depth, mtime, subdirs, files = future.result()
+                    if subdirs is None:
+                        yield dirpath, mtime, None, None
+                        continue
+                    if max_depth is not None and depth >= max_depth:
+                        subdirs = []
+                    elif exclude_patterns:
+                        subdirs = [(path, sub_mtime) for path, sub_mtime in subdirs
+                                   if not _is_excluded(os.path.basename(path), exclude_patterns)]
+                    yield dirpath, mtime, subdirs, files
+                    for path, sub_mtime in subdirs:
+                        pending.add(submit(path, depth + 1, sub_mtime))
+        finally:
+            # Закрытый раньше времени обход не дочитывает папки, ждущие в очереди пула
+            pool.shutdown(cancel_futures=True)
+
+
+def iter_work_files(root_folder, file_extensions, created_by=None, **crawl_options):
+    if created_by is None:
+        created_by = getpass.getuser()
+    for dirpath, _, _, files in crawl(root_folder, file_extensions, **crawl_options):
+        if not files:
+            continue
+        parent_folder = os.path.basename(os.path.dirname(dirpath))
+        for filename, file_path, mtime, size in files:
+            yield parent_folder, file_path, filename, mtime, created_by, size
+
+
+def _crawl_options_key(root_folder, file_extensions, crawl_options):
+    return repr((os.path.abspath(root_folder), tuple(file_extensions),
+                 crawl_options.get("max_depth"), tuple(crawl_options.get("exclude_patterns", ()))))
+
+
+class RootScan:
+    # Запись обхода одного корня в базу: результаты crawl() подаются в add(), finish() завершает обход.
+    # Файлы копятся пачками и пишутся одной транзакцией на пачку.
+    # В инкрементальном режиме пишутся только отличия от уже сохраненного состояния корня:
+    # новые и измененные (по size/mtime) файлы, удаленные файлы и папки
+    def __init__(self, conn, root_folder, file_extensions, batch_size=BATCH_SIZE, incremental=False,
+                 **crawl_options):
+        self.conn = conn
+        self.root = os.path.abspath(root_folder)
+        self.batch_size = batch_size
+        self.created_by = getpass.getuser()
+        self.setting_key = f"crawl_options {self.root}"
+        self.options_key = _crawl_options_key(self.root, file_extensions, crawl_options)
+        if incremental:
+            claim_root(conn, self.root)
+        self.known_files = load_file_signatures(conn, self.root) if incremental else {}
+        # После смены настроек обхода прежним mtime папок доверять нельзя
+        self.known_dirs = (load_directories(conn, self.root)
+                           if incremental and get_setting(conn, self.setting_key) == self.options_key else {})
+        self.seen_paths = set()
+        self.seen_dirs = {}
+        # Папки, которые не удалось пролистать: под ними ничего не удаляется
+        self.unlisted = []
+        self.parents = {self.root: None}
+        self.inserts = []
+        self.updates = []
+        self.count = 0
+
+    def add(self, dirpath, mtime, subdirs, files):
+        # Возвращает True, если накопленная пачка записана
+        if subdirs is None:
+            # mtime тоже не запоминается, чтобы следующий обход пролистал папку заново
+            self.unlisted.append(dirpath)
+            return False
+        self.seen_dirs[dirpath] = mtime
+        for path, _ in subdirs:
+            self.parents[path] = dirpath
+        metrics.count("scan_dirs")
+        # stat подпапок и файлов "Работа" из листинга; непролистанная папка обходится без них
+        metrics.count("scan_stat_calls", len(subdirs) + len(files or ()))
+        if files is None:
+            return False
+        metrics.count("scan_files", len(files))
+        parent_folder = os.path.basename(os.path.dirname(dirpath))
+        for filename, file_path, last_modified, size in files:
+            self.seen_paths.add(file_path)
+            known = self.known_files.get(file_path)
+            if known is None:
+                self.inserts.append((parent_folder, file_path, filename, last_modified, self.created_by, size))
+            elif known[1] != size or known[2] != last_modified:
+                self.updates.append((last_modified, size, known[0]))
+        self.count += len(files)
+        if len(self.inserts) + len(self.updates) >= self.batch_size:
+            self.flush()
+            return True
+        return False
+
+    def flush(self):
+        if not self.inserts and not self.updates:
+            return
+        metrics.count("db_rows", len(self.inserts) + len(self.updates))
+        with metrics.timed("db_write"):
+            if self.inserts:
+                insert_files(self.conn, self.inserts, self.root)
+            if self.updates:
+                update_files(self.conn, self.updates)
+        self.inserts = []
+        self.updates = []
+
+    def finish(self):
+        self.flush()
+        unlisted = set(self.unlisted)
+        unlisted_prefixes = tuple(folder + os.sep for folder in self.unlisted)
+
+        def is_unlisted(path):
+            return path in unlisted or path.startswith(unlisted_prefixes)
+
+        removed_files = [known[0] for path, known in self.known_files.items()
+                         if path not in self.seen_paths and not is_unlisted(path)]
+        if removed_files:
+            metrics.count("db_rows", len(removed_files))
+            with metrics.timed("db_write"):
+                delete_files(self.conn, removed_files)
+        dir_rows = [(path, self.parents[path], mtime)
+                    for path, mtime in self.seen_dirs.items()
+                    if path not in self.known_dirs or self.known_dirs[path][0] != mtime]
+        known_dirs = self.known_dirs or load_directory_paths(self.conn, self.root)
+        removed_dirs = [path for path in known_dirs if path not in self.seen_dirs and not is_unlisted(path)]
+        with metrics.timed("db_write"):
+            save_directories(self.conn, dir_rows, removed_dirs, self.root)
+        set_setting(self.conn, self.setting_key, self.options_key)
+        return self.count
+
+
+def scan_to_database(conn, root_folder, file_extensions, batch_size=BATCH_SIZE, progress=None,
+                     incremental=False, cancelled=None, **crawl_options):
+    # progress(count) вызывается после каждой записанной пачки.
+    # cancelled() - проверка прерывания перед каждой папкой: прерванный обход оставляет записанные файлы,
+    # но не удаляет пропавшие и не сохраняет папки - по неполному обходу их не определить
+    with metrics.timed("scan"):
+        scan = RootScan(conn, root_folder, file_extensions, batch_size, incremental, **crawl_options)
+        entries = crawl(scan.root, file_extensions, known_dirs=scan.known_dirs, **crawl_options)
+        for entry in entries:
+            if cancelled is not None and cancelled():
+                entries.close()
+                scan.flush()
+                return scan.count
+            if scan.add(*entry) and progress:
+                progress(scan.count)
+        count = scan.finish()
+    if progress:
+        progress(count)
+    return count
+
+
+# Результаты обхода в процессе пула отправляются в базу пачками по столько папок
+CRAWL_CHUNK_DIRS = 500
+
+_crawl_results = None
+_crawl_stop = None
+
+
+def _init_crawl_process(results, stop):
+    # Процесс пула не ждет при выходе, пока родитель вычитает его части из очереди: при обычном
+    # завершении родитель уже прочитал все до (корень, None), а после ошибки в родителе читать некому
+    global _crawl_results, _crawl_stop
+    results.cancel_join_thread()
+    _crawl_results = results
+    _crawl_stop = stop
+
+
+def _crawl_root(root_folder, file_extensions, known_dirs, crawl_options):
+    # Работает в процессе пула: обходит один корень и кладет в общую очередь (корень, [записи crawl]),
+    # в конце (корень, None) - даже при ошибке, которую затем поднимает future.
+    # Обход прекращается, если родитель выставил _crawl_stop
+    chunk = []
+    try:
+        for entry in crawl(root_folder, file_extensions, known_dirs=known_dirs, **crawl_options):
+            if _crawl_stop.is_set():
+                return
+            chunk.append(entry)
+            if len(chunk) >= CRAWL_CHUNK_DIRS:
+                _crawl_results.put((root_folder, chunk))
+                chunk = []
+        if chunk:
+            _crawl_results.put((root_folder, chunk))
+    finally:
+        _crawl_results.put((root_folder, None))
+
+
+def scan_roots(conn, root_folders, file_extensions, processes=None, batch_size=BATCH_SIZE, progress=None,
+               incremental=False, **crawl_options):
+    # Несколько корней в одну базу: каждый корень обходится в своем процессе,
+    # пишет в базу только этот процесс. Возвращает {корень: число файлов}
+    started = time.perf_counter()
+    scans = {}
+    for root_folder in root_folders:
+        scan = RootScan(conn, root_folder, file_extensions, batch_size, incremental, **crawl_options)
+        scans[scan.root] = scan
+    counts = {}
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    processes = processes or min(len(scans), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_crawl_process,
+                             initargs=(results, stop)) as pool:
+        futures = {root: pool.submit(_crawl_root, root, file_extensions, scan.known_dirs, crawl_options)
+                   for root, scan in scans.items()}
+        try:
+            _collect_crawl_results(results, futures, scans, counts, progress)
+        except BaseException:
+            # Выход из with ждет процессы пула: еще не начатые корни отменяются, начатые прекращают обход
+            stop.set()
+            for future in futures.values():
+                future.cancel()
+            raise
+    if progress:
+        progress(sum(counts.values()))
+    metrics.observe("scan", time.perf_counter() - started)
+    return counts
+
+
+def _collect_crawl_results(results, futures, scans, counts, progress):
+    # Пишет части обхода из очереди процессов пула в базу, пока все корни не закончатся
+    while len(counts) < len(scans):
+        try:
+            root, chunk = results.get(timeout=1)
+        except queue.Empty:
+            # Упавший процесс пула не успевает положить конец своего корня
+            for future in futures.values():
+                if future.done() and future.exception() is not None:
+                    raise future.exception()
+            continue
+        if chunk is None:
+            futures[root].result()
+            counts[root] = scans[root].finish()
+        else:
+            flushed = False
+            for entry in chunk:
+                flushed = scans[root].add(*entry) or flushed
+            if flushed and progress:
+                progress(sum(scan.count for scan in scans.values()))
@@ -0,0 +1,97 @@
+import queue
+import threading
+
+from metrics import thread_profiled
+
+# Долгие операции GUI (сканирование, сравнение, отчеты) в фоновом потоке: главный поток Tk
+# только забирает сообщения через root.after и никогда не ждет саму операцию
+
+PROGRESS = "progress"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Как часто track() сообщает о прогрессе, в элементах
+PROGRESS_EVERY = 500
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class BackgroundTask:
+    # function(task, *args) работает в своем потоке: task.report(value) отправляет промежуточный результат,
+    # task.check() поднимает TaskCancelled после cancel(). interrupt - необязательная функция, которую cancel()
+    # вызывает из главного потока (например, Connection.interrupt для долгого запроса).
+    # dispatch() в главном потоке вызывает обработчики и возвращает True, когда операция закончилась
+    def __init__(self, function, *args, on_progress=None, on_done=None, on_cancelled=None, on_failed=None):
+        self.function = function
+        self.args = args
+        self.handlers = {PROGRESS: on_progress, DONE: on_done, CANCELLED: on_cancelled, FAILED: on_failed}
+        self.interrupt = None
+        self.messages = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+        if self.interrupt is not None:
+            self.interrupt()
+
+    def join(self):
+        self._thread.join()
+
+    def is_cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise TaskCancelled()
+
+    def report(self, value):
+        self.messages.put((PROGRESS, value))
+
+    def track(self, items, every=PROGRESS_EVERY):
+        # Пропускает элементы итератора с проверкой отмены и сообщает их число каждые every элементов
+        count = 0
+        for item in items:
+            self.check()
+            yield item
+            count += 1
+            if count % every == 0:
+                self.report(count)
+
+    def _run(self):
+        # Исключение после cancel() - следствие прерывания, а не ошибка
+        try:
+            with thread_profiled():
+                result = self.function(self, *self.args)
+        except TaskCancelled:
+            self.messages.put((CANCELLED, None))
+        except Exception as e:
+            self.messages.put((CANCELLED, None) if self._cancel.is_set() else (FAILED, e))
+        else:
+            self.messages.put((CANCELLED if self._cancel.is_set() else DONE, result))
+
+    def dispatch(self):
+        # Из накопившихся сообщений о прогрессе обработчик получает только последнее
+        progress = None
+        while True:
+            try:
+                kind, value = self.messages.get_nowait()
+            except queue.Empty:
+                break
+            if kind == PROGRESS:
+                progress = (value,)
+                continue
+            if progress is not None and self.handlers[PROGRESS]:
+                self.handlers[PROGRESS](*progress)
+            if self.handlers[kind]:
+                self.handlers[kind](value)
+            return True
+        if progress is not None and self.handlers[PROGRESS]:
+            self.handlers[PROGRESS](*progress)
+        return False
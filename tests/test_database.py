@@ -0,0 +1,200 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+
+from database import (open_database, insert_files, find_latest_database, compare_with_database, load_files_page,
+                      load_compare_page, FILE_SORT_KEYS, COMPARE_NEW, COMPARE_CHANGED, COMPARE_MISSING,
+                      COMPARE_UNCHANGED)
+
+
+class FindLatestDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def touch(self, name):
+        with open(os.path.join(self.tmp, name), "w"):
+            pass
+
+    def test_ignores_other_project_with_same_prefix(self):
+        self.touch("BD_Проект_2024-05-01_10-00-00.db")
+        self.touch("BD_Проект_2_2023-01-01_10-00-00.db")
+        self.touch("BD_Проект_2_2025-01-01_10-00-00.db")
+        self.assertEqual(find_latest_database(self.tmp, "Проект"),
+                         os.path.join(self.tmp, "BD_Проект_2024-05-01_10-00-00.db"))
+        self.assertEqual(find_latest_database(self.tmp, "Проект_2"),
+                         os.path.join(self.tmp, "BD_Проект_2_2025-01-01_10-00-00.db"))
+
+    def test_newest_by_timestamp(self):
+        self.touch("BD_Проект_2024-05-01_10-00-00.db")
+        self.touch("BD_Проект_2024-05-01_09-59-59.db")
+        self.touch("BD_Проект_2024-05-01_10-00-00.db-wal")
+        self.assertEqual(find_latest_database(self.tmp, "Проект"),
+                         os.path.join(self.tmp, "BD_Проект_2024-05-01_10-00-00.db"))
+
+    def test_none_when_missing(self):
+        self.touch("BD_Проект_2_2024-05-01_10-00-00.db")
+        self.assertIsNone(find_latest_database(self.tmp, "Проект"))
+
+
+
+class CompareWithDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.conn = open_database(os.path.join(self.tmp, "new.db"))
+        insert_files(self.conn, [
+            ("P", "/p/Работа/a.rvt", "a.rvt", datetime(2024, 5, 1, 10).timestamp(), "user", 1),
+            ("P", "/p/Работа/b.rvt", "b.rvt", datetime(2024, 5, 2, 10).timestamp(), "user", 1),
+            ("P", "/p/Работа/c.rvt", "c.rvt", 1700000000.0, "user", 1),
+        ])
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def make_legacy_database(self):
+        # Схема до версии 1: без UNIQUE на path, last_modified - строка местного времени
+        path = os.path.join(self.tmp, "legacy.db")
+        legacy = sqlite3.connect(path)
+        legacy.execute('''
+            CREATE TABLE files (id INTEGER PRIMARY KEY, parent_folder TEXT, path TEXT, filename TEXT,
+                                last_modified TEXT, created_by TEXT)
+        ''')
+        legacy.executemany("INSERT INTO files (parent_folder, path, filename, last_modified, created_by) "
+                           "VALUES (?, ?, ?, ?, ?)", [
+                               ("P", "/p/Работа/a.rvt", "a.rvt", "2024-04-01 10:00:00", "user"),
+                               ("P", "/p/Работа/a.rvt", "a.rvt", "2024-05-01 10:00:00", "user"),
+                               ("P", "/p/Работа/b.rvt", "b.rvt", "2024-05-01 10:00:00", "user"),
+                               ("P", "/p/Работа/d.rvt", "d.rvt", "2024-05-01 10:00:00", "user"),
+                           ])
+        legacy.commit()
+        legacy.close()
+        return path
+
+    def test_legacy_snapshot_is_compared_without_changes(self):
+        old_path = self.make_legacy_database()
+        with open(old_path, "rb") as old_file:
+            before = old_file.read()
+        counts = compare_with_database(self.conn, old_path)
+        self.assertEqual(counts, {COMPARE_NEW: 1, COMPARE_CHANGED: 1, COMPARE_MISSING: 1, COMPARE_UNCHANGED: 1})
+        with open(old_path, "rb") as old_file:
+            self.assertEqual(old_file.read(), before)
+        self.assertFalse(os.path.exists(old_path + "-wal"))
+
+    def test_missing_database_is_an_error(self):
+        missing = os.path.join(self.tmp, "missing.db")
+        with self.assertRaises(ValueError):
+            compare_with_database(self.conn, missing)
+        self.assertFalse(os.path.exists(missing))
+
+    def test_database_without_files_table_is_an_error(self):
+        other = os.path.join(self.tmp, "other.db")
+        sqlite3.connect(other).close()
+        with self.assertRaises(ValueError):
+            compare_with_database(self.conn, other)
+
+
+class LoadFilesPageTest(unittest.TestCase):
+    # Страницы по ключу должны складываться в тот же порядок, что и вся выборка целиком
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.conn = open_database(os.path.join(self.tmp, "test.db"))
+        rows = []
+        for n in range(40):
+            folder = f"P{n % 3}"
+            filename = f"m{n % 7}.rvt"
+            rows.append((folder, f"/{folder}/{n:02d}/{filename}", filename, 1700000000.0 + n % 5,
+                         None if n % 4 == 0 else f"user{n % 2}", 1))
+        insert_files(self.conn, rows)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def ids(self, rows):
+        return [row[0] for row in rows]
+
+    def test_created_by_is_never_null(self):
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM files WHERE created_by IS NULL").fetchone()[0], 0)
+        # База версии 4 с NULL, записанным до миграции
+        with self.conn:
+            self.conn.execute("UPDATE files SET created_by = NULL WHERE id = 1")
+        self.conn.execute("PRAGMA user_version = 4")
+        self.conn.close()
+        self.conn = open_database(os.path.join(self.tmp, "test.db"))
+        self.assertEqual(self.conn.execute("SELECT created_by FROM files WHERE id = 1").fetchone()[0], "")
+
+    def test_pages_by_key_in_both_directions(self):
+        for sort in FILE_SORT_KEYS:
+            for descending in (False, True):
+                with self.subTest(sort=sort, descending=descending):
+                    expected = self.ids(load_files_page(self.conn, 80, 1000, sort, descending))
+                    self.assertEqual(len(expected), 40)
+                    forward = load_files_page(self.conn, 80, 7, sort, descending)
+                    pages = list(forward)
+                    while forward:
+                        forward = load_files_page(self.conn, 80, 7, sort, descending, after=forward[-1][7:])
+                        pages += forward
+                    self.assertEqual(self.ids(pages), expected)
+                    backward = load_files_page(self.conn, 80, 7, sort, descending, backward=True)
+                    pages = list(backward)
+                    while backward:
+                        backward = load_files_page(self.conn, 80, 7, sort, descending, after=backward[0][7:],
+                                                   backward=True)
+                        pages = backward + pages
+                    self.assertEqual(self.ids(pages), expected)
+                    middle = load_files_page(self.conn, 80, 5, sort, descending, skip=10)
+                    self.assertEqual(self.ids(middle), expected[10:15])
+                    self.assertEqual(self.ids(load_files_page(self.conn, 80, 5, sort, descending,
+                                                              after=middle[0][7:], inclusive=True)),
+                                     expected[10:15])
+                    self.assertEqual(self.ids(load_files_page(self.conn, 80, 5, sort, descending,
+                                                              after=middle[0][7:], backward=True, skip=3)),
+                                     expected[2:7])
+
+    def test_filtered_pages(self):
+        expected = self.ids(load_files_page(self.conn, 80, 1000, "filename", folder="P1"))
+        first = load_files_page(self.conn, 80, 4, "filename", folder="P1")
+        rest = load_files_page(self.conn, 80, 1000, "filename", folder="P1", after=first[-1][7:])
+        self.assertEqual(self.ids(first + rest), expected)
+        self.assertTrue(all(row[2] == "P1" for row in first + rest))
+
+
+class LoadComparePageTest(unittest.TestCase):
+    def setUp(self):
+        # По 10 строк каждого статуса: новые, отсутствующие, без изменений
+        self.tmp = tempfile.mkdtemp()
+        rows = [("P", f"/p/{n:02d}.rvt", f"{n:02d}.rvt", 1700000000.0, "user", 1) for n in range(30)]
+        old_conn = open_database(os.path.join(self.tmp, "old.db"))
+        insert_files(old_conn, rows[:20])
+        old_conn.close()
+        self.conn = open_database(os.path.join(self.tmp, "new.db"))
+        insert_files(self.conn, rows[10:])
+        compare_with_database(self.conn, os.path.join(self.tmp, "old.db"))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def test_pages_with_and_without_status(self):
+        for status in (None, COMPARE_NEW, COMPARE_MISSING):
+            with self.subTest(status=status):
+                expected = [row[0] for row in load_compare_page(self.conn, 1000, status)]
+                self.assertTrue(expected)
+                page = load_compare_page(self.conn, 3, status, skip=2)
+                self.assertEqual([row[0] for row in page], expected[2:5])
+                page = load_compare_page(self.conn, 3, status, after=page[-1][0])
+                self.assertEqual([row[0] for row in page], expected[5:8])
+                page = load_compare_page(self.conn, 2, status, after=page[0][0], backward=True, skip=1)
+                self.assertEqual([row[0] for row in page], expected[2:4])
+                page = load_compare_page(self.conn, 3, status, backward=True, skip=1)
+                self.assertEqual([row[0] for row in page], expected[-4:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
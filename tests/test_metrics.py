@@ -0,0 +1,33 @@
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+
+from metrics import profiled
+from tasks import BackgroundTask
+
+
+def slow_step(task):
+    return sum(range(1000))
+
+
+class ProfiledTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_background_task_is_in_profile(self):
+        path = os.path.join(self.tmp, "gui.pstats")
+        with profiled(path):
+            task = BackgroundTask(slow_step)
+            task.start()
+            task.join()
+        functions = {name for _, _, name in pstats.Stats(path).stats}
+        self.assertIn("slow_step", functions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from database import open_database
+from monitor import EventPipeline, UPSERT, DELETE, MOVE
+from scanner import WORK_FOLDER_NAME, get_file_extensions, scan_to_database
+
+
+class EventPipelineMergeTest(unittest.TestCase):
+    # События подаются в _merge/_apply напрямую, как их слил бы _collect за одну пачку
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.work_dir = os.path.join(self.tmp, "tree", "Проект", WORK_FOLDER_NAME)
+        os.makedirs(self.work_dir)
+        for name in ("a.dwg", "m.rvt", "x.rvt"):
+            self.write(name)
+        self.file_extensions = get_file_extensions(True, True)
+        self.db_path = os.path.join(self.tmp, "test.db")
+        self.conn = open_database(self.db_path)
+        self.root = os.path.join(self.tmp, "tree")
+        scan_to_database(self.conn, self.root, self.file_extensions)
+        self.pipeline = EventPipeline(self.db_path, self.file_extensions, root=self.root)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def path(self, name):
+        return os.path.join(self.work_dir, name)
+
+    def write(self, name):
+        with open(self.path(name), "w") as file:
+            file.write(name)
+
+    def rename(self, src, dest):
+        os.replace(self.path(src), self.path(dest))
+        return MOVE, (self.path(src), self.path(dest))
+
+    def apply(self, *events):
+        pending = {}
+        for kind, path in events:
+            self.pipeline._merge(pending, kind, path, time.monotonic())
+        self.pipeline._apply(self.conn, pending, len(events))
+        return self.pipeline.batches.get_nowait()
+
+    def indexed(self):
+        return dict(self.conn.execute("SELECT filename, id FROM files"))
+
+    def test_safe_save_keeps_model(self):
+        # AutoCAD: запись во временный файл, старый файл -> .bak, временный -> на место модели
+        before = self.indexed()
+        self.write("a.$$$")
+        batch = self.apply((UPSERT, self.path("a.$$$")), self.rename("a.dwg", "a.bak"),
+                           self.rename("a.$$$", "a.dwg"))
+        self.assertEqual(batch.deleted, [])
+        self.assertEqual(batch.upserted, [self.path("a.dwg")])
+        self.assertEqual(self.indexed()["a.dwg"], before["a.dwg"])
+
+    def test_revit_backup_rename_keeps_model(self):
+        # Revit: модель -> резервная копия m.0001.rvt, временный файл -> m.rvt
+        self.write("m.tmp")
+        self.apply(self.rename("m.rvt", "m.0001.rvt"), self.rename("m.tmp", "m.rvt"))
+        self.assertIn("m.rvt", self.indexed())
+        self.assertNotIn("m.0001.rvt", self.indexed())
+
+    def test_rename_to_ignored_name_deletes(self):
+        self.apply(self.rename("a.dwg", "a.bak"))
+        self.assertNotIn("a.dwg", self.indexed())
+
+    def test_rename_chain_moves_original_row(self):
+        before = self.indexed()
+        batch = self.apply(self.rename("x.rvt", "y.rvt"), self.rename("y.rvt", "z.rvt"))
+        self.assertEqual(batch.moved, [(self.path("x.rvt"), self.path("z.rvt"))])
+        after = self.indexed()
+        self.assertNotIn("x.rvt", after)
+        self.assertNotIn("y.rvt", after)
+        self.assertEqual(after["z.rvt"], before["x.rvt"])
+
+    def test_rename_chain_to_ignored_name_deletes_original(self):
+        self.apply(self.rename("x.rvt", "y.rvt"), self.rename("y.rvt", "y.bak"))
+        after = self.indexed()
+        self.assertNotIn("x.rvt", after)
+        self.assertNotIn("y.rvt", after)
+
+    def test_delete_then_recreate_keeps_file(self):
+        os.remove(self.path("a.dwg"))
+        self.write("a.dwg")
+        self.apply((DELETE, self.path("a.dwg")), (UPSERT, self.path("a.dwg")))
+        self.assertIn("a.dwg", self.indexed())
+
+    def test_after_write_runs_before_batch_is_published(self):
+        calls = []
+        self.pipeline.after_write = lambda conn: calls.append((conn, self.pipeline.batches.qsize()))
+        self.write("n.rvt")
+        self.apply((UPSERT, self.path("n.rvt")))
+        self.assertEqual(calls, [(self.conn, 0)])
+        # Пачка без записей в базу - без пересчета
+        self.apply((UPSERT, self.path("~n.tmp")))
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_write_is_reported_and_retried(self):
+        self.conn.close()
+        pipeline = EventPipeline(self.db_path, self.file_extensions, debounce=0.05, root=self.root,
+                                 db_timeout=0.1, retry_delay=0.1)
+        pipeline.start()
+        locker = sqlite3.connect(self.db_path)
+        try:
+            self.write("n.rvt")
+            pipeline.events.put((UPSERT, self.path("n.rvt"), time.monotonic()))
+            self.assertEqual(pipeline.batches.get(timeout=10).upserted, [self.path("n.rvt")])
+            # Другой писатель держит базу дольше, чем ждет запись пачки
+            locker.execute("BEGIN IMMEDIATE")
+            self.write("p.rvt")
+            pipeline.events.put((UPSERT, self.path("p.rvt"), time.monotonic()))
+            failed = pipeline.batches.get(timeout=10)
+            self.assertIsInstance(failed.error, sqlite3.OperationalError)
+            self.assertEqual(failed.upserted, [])
+            locker.rollback()
+            retried = pipeline.batches.get(timeout=10)
+            while retried.error is not None:
+                retried = pipeline.batches.get(timeout=10)
+            self.assertEqual(retried.upserted, [self.path("p.rvt")])
+            self.assertEqual(retried.events, 1)
+        finally:
+            pipeline.stop()
+            locker.close()
+        self.conn = open_database(self.db_path)
+        self.assertIn("p.rvt", self.indexed())
+
+if __name__ == "__main__":
+    unittest.main()
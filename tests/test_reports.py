@@ -0,0 +1,36 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import reportlab
+from reportlab.pdfbase.ttfonts import TTFont
+
+from reports import FONT_CANDIDATES, CYRILLIC_PROBE, write_pdf_report
+
+ROWS = [("Ж.rvt", "Проект", "/Проект/Работа/Ж.rvt", "2024-05-01 10:00:00", "user")]
+
+
+class PdfFontTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.pdf_path = os.path.join(self.tmp, "report.pdf")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_bundled_font_has_cyrillic(self):
+        bundled = FONT_CANDIDATES[0]
+        self.assertTrue(os.path.isfile(bundled))
+        self.assertIn(ord(CYRILLIC_PROBE), TTFont("Bundled", bundled).face.charToGlyph)
+        self.assertEqual(write_pdf_report(self.pdf_path, "Проект", ROWS), 1)
+
+    def test_font_without_cyrillic_is_an_error(self):
+        vera = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+        with self.assertRaises(ValueError):
+            write_pdf_report(self.pdf_path, "Проект", ROWS, font_path=vera)
+        self.assertFalse(os.path.exists(self.pdf_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
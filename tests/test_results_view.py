@@ -0,0 +1,153 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from database import open_database, insert_files, delete_files
+from results_view import ResultsView, FilesSource
+
+VISIBLE = 10
+# Заголовки и строки "отрисованной" таблицы, bbox - (x, y, ширина, высота)
+HEADING_HEIGHT = 25
+ROW_HEIGHT = 18
+
+
+class FakeTree:
+    # Минимум Treeview, который использует ResultsView: пока height = 1, окно не отрисовано
+    # и его высота - из cget("height"), иначе строки меряются по bbox
+    def __init__(self):
+        self.items = []
+        self.height = 1
+        self.focused = ""
+        self.selected = ()
+
+    def bind(self, sequence, handler):
+        pass
+
+    def winfo_height(self):
+        return self.height
+
+    def bbox(self, item):
+        return (0, HEADING_HEIGHT + self.items.index(item) * ROW_HEIGHT, 100, ROW_HEIGHT)
+
+    def focus(self, item=None):
+        if item is None:
+            return self.focused
+        self.focused = item
+
+    def selection_set(self, item):
+        self.selected = (item,)
+
+    def cget(self, option):
+        return VISIBLE
+
+    def insert(self, parent, index, iid, values, tags):
+        self.items.insert(index, iid)
+
+    def delete(self, *items):
+        for item in items:
+            self.items.remove(item)
+
+    def item(self, item, values, tags):
+        pass
+
+    def index(self, item):
+        return self.items.index(item)
+
+    def move(self, item, parent, index):
+        self.items.remove(item)
+        self.items.insert(index, item)
+
+
+class FakeScrollbar:
+    def config(self, command):
+        pass
+
+    def set(self, first, last):
+        self.position = (first, last)
+
+
+class ResultsViewTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.conn = open_database(os.path.join(self.tmp, "test.db"))
+        rows = []
+        for n in range(500):
+            folder = f"P{n % 9}"
+            rows.append((folder, f"/{folder}/{n:03d}.rvt", f"m{n % 13}.rvt", 1700000000.0 + n % 17, "user", 1))
+        insert_files(self.conn, rows)
+        self.tree = FakeTree()
+        self.view = ResultsView(self.tree, FakeScrollbar())
+        self.view.set_source(FilesSource(self.conn, 80, "filename"))
+        self.expected = [item for item, _, _, _ in self.view.source.page(1000)]
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def assertWindowAt(self, offset):
+        self.assertEqual(self.view.offset, offset)
+        self.assertEqual(self.tree.items, self.expected[offset:offset + VISIBLE])
+
+    def test_scrolling_matches_offsets(self):
+        self.assertWindowAt(0)
+        self.view.scroll_by(3)
+        self.assertWindowAt(3)
+        self.view.scroll_by(VISIBLE)
+        self.assertWindowAt(13)
+        self.view.scroll_by(-2)
+        self.assertWindowAt(11)
+        self.view.scroll_by(-100)
+        self.assertWindowAt(0)
+        self.view.scroll_to(10 ** 6)
+        self.assertWindowAt(500 - VISIBLE)
+        self.view.scroll_by(5)
+        self.assertWindowAt(500 - VISIBLE)
+        rng = random.Random(0)
+        for _ in range(200):
+            target = rng.choice((rng.randrange(500), self.view.offset + rng.randint(-40, 40)))
+            self.view.scroll_to(target)
+            self.assertWindowAt(max(0, min(target, 500 - VISIBLE)))
+
+    def test_rows_fit_measured_height(self):
+        # Новый источник заполняет окно по высоте строки по умолчанию (11 строк)
+        # и перечитывает его, как только первая строка измерена
+        self.tree.height = HEADING_HEIGHT + 12 * ROW_HEIGHT + ROW_HEIGHT // 2
+        self.view.set_source(FilesSource(self.conn, 80, "filename"))
+        self.assertEqual(self.view.visible_rows(), 12)
+        self.assertEqual(self.tree.items, self.expected[:12])
+
+    def test_arrows_move_window_at_edges(self):
+        self.tree.focused = self.tree.items[3]
+        self.assertIsNone(self.view.on_arrow(1))
+        self.tree.focused = self.tree.items[-1]
+        self.assertEqual(self.view.on_arrow(1), "break")
+        self.assertWindowAt(1)
+        self.assertEqual(self.tree.focused, self.expected[VISIBLE])
+        self.assertEqual(self.tree.selected, (self.expected[VISIBLE],))
+        self.tree.focused = self.tree.items[0]
+        self.view.on_arrow(-1)
+        self.view.on_arrow(-1)
+        self.assertWindowAt(0)
+        self.assertEqual(self.tree.focused, self.expected[0])
+
+    def test_refresh_keeps_first_row(self):
+        self.view.scroll_to(200)
+        first = self.tree.items[0]
+        insert_files(self.conn, [("P0", "/P0/zzz.rvt", "a.rvt", 1700000000.0, "user", 1)])
+        self.view.refresh()
+        self.assertEqual(self.view.total, 501)
+        self.assertEqual(self.tree.items[0], first)
+
+    def test_refresh_at_end_after_delete(self):
+        self.view.scroll_to(500)
+        last = self.view.source.page(1, backward=True)[0]
+        delete_files(self.conn, [int(last[0])])
+        self.view.refresh()
+        self.expected.remove(last[0])
+        self.assertWindowAt(499 - VISIBLE)
+
+
+if __name__ == "__main__":
+    unittest.main()
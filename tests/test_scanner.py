@@ -0,0 +1,190 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from io import StringIO
+
+import cli
+from database import open_database, HISTORY_DELETED
+from scanner import WORK_FOLDER_NAME, scan_roots, scan_to_database, get_file_extensions
+
+REPO_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Запускается отдельным процессом: если scan_roots зависнет, зависнет он, а не набор тестов
+FAILING_SCAN = '''
+import sys
+from database import open_database
+from scanner import scan_roots, get_file_extensions
+
+
+def progress(count):
+    raise RuntimeError("ошибка записи")
+
+
+conn = open_database(sys.argv[1])
+try:
+    scan_roots(conn, sys.argv[2:], get_file_extensions(True, False), processes=2, batch_size=10, progress=progress)
+except RuntimeError:
+    sys.exit(0)
+sys.exit(1)
+'''
+
+
+class ScanRootsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # Корни на несколько частей обхода каждый: пока родитель не читает очередь, она переполняется
+        self.roots = []
+        for root_index in range(2):
+            root = os.path.join(self.tmp, f"root{root_index}")
+            for n in range(3000):
+                work_dir = os.path.join(root, f"Проект_{n:04d}", WORK_FOLDER_NAME)
+                os.makedirs(work_dir)
+                with open(os.path.join(work_dir, f"model_{n:04d}.rvt"), "w"):
+                    pass
+            self.roots.append(root)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_all_chunks_are_written(self):
+        conn = open_database(os.path.join(self.tmp, "test.db"))
+        try:
+            counts = scan_roots(conn, self.roots, get_file_extensions(True, False), processes=2)
+            self.assertEqual(sorted(counts.values()), [3000, 3000])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM files").fetchone()[0], 6000)
+        finally:
+            conn.close()
+
+    def test_error_in_parent_does_not_hang(self):
+        result = subprocess.run([sys.executable, "-c", FAILING_SCAN, os.path.join(self.tmp, "test.db"),
+                                 *self.roots], cwd=REPO_FOLDER, capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class IncrementalScanTest(unittest.TestCase):
+    # Недоступная папка при повторном обходе - неизвестное состояние, а не удаление файлов
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "root")
+        for project in ("A", "B"):
+            work_dir = self.work_dir(project)
+            os.makedirs(work_dir)
+            with open(os.path.join(work_dir, f"{project}.rvt"), "w"):
+                pass
+        self.file_extensions = get_file_extensions(True, False)
+        self.conn = open_database(os.path.join(self.tmp, "test.db"))
+        scan_to_database(self.conn, self.root, self.file_extensions)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def work_dir(self, project):
+        return os.path.join(self.root, project, WORK_FOLDER_NAME)
+
+    def indexed(self):
+        return sorted(row[0] for row in self.conn.execute("SELECT filename FROM files"))
+
+    def deleted_events(self):
+        return self.conn.execute("SELECT COUNT(*) FROM file_history WHERE event = ?",
+                                 (HISTORY_DELETED,)).fetchone()[0]
+
+    def failing_scandir(self, failing):
+        def scandir(path):
+            if path in failing:
+                raise PermissionError(path)
+            return os.scandir(path)
+        return scandir
+
+    def test_unreachable_root_raises_and_keeps_index(self):
+        os.rename(self.root, self.root + "_offline")
+        with self.assertRaises(OSError):
+            scan_to_database(self.conn, self.root, self.file_extensions, incremental=True)
+        self.assertEqual(self.indexed(), ["A.rvt", "B.rvt"])
+        self.assertEqual(self.deleted_events(), 0)
+
+    def test_unreachable_root_in_scan_roots(self):
+        os.rename(self.root, self.root + "_offline")
+        with self.assertRaises(OSError):
+            scan_roots(self.conn, [self.root], self.file_extensions, processes=1, incremental=True)
+        self.assertEqual(self.indexed(), ["A.rvt", "B.rvt"])
+        self.assertEqual(self.deleted_events(), 0)
+
+    def test_unlisted_work_folder_keeps_its_files(self):
+        os.remove(os.path.join(self.work_dir("B"), "B.rvt"))
+        scan_to_database(self.conn, self.root, self.file_extensions, incremental=True,
+                         scandir=self.failing_scandir({self.work_dir("A")}))
+        self.assertEqual(self.indexed(), ["A.rvt"])
+        self.assertIn(self.work_dir("A"), [row[0] for row in self.conn.execute("SELECT path FROM dirs")])
+
+    def test_unlisted_folder_keeps_its_subtree(self):
+        project = os.path.join(self.root, "A")
+        scan_to_database(self.conn, self.root, self.file_extensions, incremental=True,
+                         scandir=self.failing_scandir({project}))
+        self.assertEqual(self.indexed(), ["A.rvt", "B.rvt"])
+        dirs = [row[0] for row in self.conn.execute("SELECT path FROM dirs")]
+        self.assertIn(project, dirs)
+        self.assertIn(self.work_dir("A"), dirs)
+        # Когда папка снова доступна, она листается заново
+        scan_to_database(self.conn, self.root, self.file_extensions, incremental=True)
+        self.assertEqual(self.indexed(), ["A.rvt", "B.rvt"])
+
+
+class CrawlOptionsTest(unittest.TestCase):
+    # Папки по маске исключения и глубже max_depth не листаются вовсе
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp, "root")
+        for parts in (("A",), ("Архив_2020", "B"), ("C", "D", "E")):
+            work_dir = os.path.join(self.root, *parts, WORK_FOLDER_NAME)
+            os.makedirs(work_dir)
+            with open(os.path.join(work_dir, f"{parts[-1]}.rvt"), "w"):
+                pass
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def indexed(self, db_path):
+        conn = open_database(db_path)
+        try:
+            return sorted(row[0] for row in conn.execute("SELECT filename FROM files"))
+        finally:
+            conn.close()
+
+    def test_pruned_subtree_is_never_listed(self):
+        listed = []
+
+        def scandir(path):
+            listed.append(path)
+            return os.scandir(path)
+
+        db_path = os.path.join(self.tmp, "test.db")
+        conn = open_database(db_path)
+        try:
+            scan_to_database(conn, self.root, get_file_extensions(True, False), max_depth=3,
+                             exclude_patterns=("Архив*",), scandir=scandir)
+        finally:
+            conn.close()
+        self.assertEqual(self.indexed(db_path), ["A.rvt"])
+        self.assertIn(os.path.join(self.root, "C", "D", "E"), listed)
+        self.assertFalse([path for path in listed
+                          if "Архив_2020" in path or os.path.join("D", "E", WORK_FOLDER_NAME) in path])
+
+    def test_cli_passes_options(self):
+        for target in (["--db", os.path.join(self.tmp, "all.db")], ["--db-folder", self.tmp]):
+            with self.subTest(target=target[0]):
+                with redirect_stdout(StringIO()) as output:
+                    status = cli.main(["scan", self.root, *target, "--processes", "1", "--max-depth", "3",
+                                       "--exclude", "Архив*"])
+                self.assertEqual(status, 0)
+                # Вывод: корень, число файлов, база
+                db_path = output.getvalue().split("\t")[-1].strip()
+                self.assertEqual(self.indexed(db_path), ["A.rvt"])
+
+
+if __name__ == "__main__":
+    unittest.main()